@@ -1 +1,67 @@
-..
+from functools import lru_cache
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Application settings loaded from environment / .env file."""
+
+    # Neo4j
+    neo4j_uri: str
+    neo4j_user: str
+    neo4j_password: str
+    neo4j_database: str = "neo4j"
+    neo4j_max_connection_pool_size: int = 50
+    neo4j_connection_acquisition_timeout: float = 15.0
+    neo4j_connection_timeout: float = 5.0
+    neo4j_max_transaction_retry_time: float = 15.0
+    gds_graph_name: str = "reco"
+
+    # A/B testing
+    ab_test_threshold_date: str = "2025-01-01"
+    ab_test_data_path: str = "data/likes_data.jsonl"
+    ab_test_counts_path: str = "data/ab_test_counts.json"
+    ab_test_counts_flush_seconds: int = 30
+
+    # GNN model
+    model_checkpoint_path: str = "data/model_checkpoint.safetensors"
+    retrain_like_threshold: int = 50
+    retrain_interval_hours: int = 6
+    model_train_epochs: int = 50
+    model_learning_rate: float = 0.01
+    torch_num_threads: int = 1
+
+    # Recommendations
+    recommendation_cache_size: int = 10_000
+    recommendation_cache_ttl_seconds: int = 60
+    note_arrays_ttl_seconds: int = 30
+    score_refresh_seconds: int = 20
+    recommendation_seed_exploration: bool = False
+    note_features_cache_size: int = 10_000
+    note_features_cache_ttl_seconds: int = 60
+
+    # External API
+    external_api_base_url: str = ""
+    external_api_email: str = ""
+    external_api_password: str = ""
+    external_api_ca_bundle: str = ""
+    external_api_token_cache_path: str = "~/.cache/nhr/token.json"
+    external_api_page_size: int = 256
+    external_api_page_concurrency: int = 10
+    sync_interval_hours: int = 1
+    sync_batch_size: int = 500
+    sync_concurrency: int = 4
+
+    # Logging
+    log_level: str = "INFO"
+
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        extra="ignore",
+        frozen=True,
+        protected_namespaces=()
+    )
+
+
+@lru_cache()
+def get_settings() -> Settings:
+    return Settings()
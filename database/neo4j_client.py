@@ -1,7 +1,15 @@
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, AsyncGraphDatabase
 from config.settings import get_settings
 from typing import Optional
 
+# Unique constraints on the properties used as MATCH/MERGE keys
+UNIQUE_CONSTRAINTS = [
+    ("note_note_id", "Note", "note_id"),
+    ("user_user_id", "User", "user_id"),
+    ("tag_name", "Tag", "name"),
+    ("category_name", "Category", "name"),
+]
+
 class Neo4jClient:
     _instance: Optional['Neo4jClient'] = None
     
@@ -9,19 +17,37 @@ class Neo4jClient:
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             settings = get_settings()
-            cls._instance.driver = GraphDatabase.driver(
-                settings.neo4j_uri,
-                auth=(settings.neo4j_user, settings.neo4j_password)
+            cls._instance.database = settings.neo4j_database
+            
+            # Pool sizing shared by the sync and async drivers
+            driver_config = dict(
+                auth=(settings.neo4j_user, settings.neo4j_password),
+                max_connection_pool_size=settings.neo4j_max_connection_pool_size,
+                connection_acquisition_timeout=settings.neo4j_connection_acquisition_timeout,
+                connection_timeout=settings.neo4j_connection_timeout,
+                max_transaction_retry_time=settings.neo4j_max_transaction_retry_time,
+                keep_alive=True
             )
+            cls._instance.driver = GraphDatabase.driver(settings.neo4j_uri, **driver_config)
+            cls._instance.async_driver = AsyncGraphDatabase.driver(settings.neo4j_uri, **driver_config)
         return cls._instance
     
     def get_session(self):
-        return self.driver.session()
+        # Naming the database skips the home-database lookup round-trip
+        return self.driver.session(database=self.database)
+    
+    def get_async_session(self):
+        return self.async_driver.session(database=self.database)
     
     def close(self):
         if self.driver:
             self.driver.close()
     
+    async def close_async(self):
+        if self.async_driver:
+            await self.async_driver.close()
+        self.close()
+    
     def verify_connectivity(self) -> bool:
         try:
             with self.get_session() as session:
@@ -29,6 +55,22 @@ class Neo4jClient:
                 return result.single()["num"] == 1
         except Exception:
             return False
+    
+    async def verify_connectivity_async(self) -> bool:
+        try:
+            await self.async_driver.verify_connectivity()
+            return True
+        except Exception:
+            return False
+    
+    def ensure_constraints(self):
+        """Create unique constraints (and their backing indexes) if missing."""
+        with self.get_session() as session:
+            for name, label, prop in UNIQUE_CONSTRAINTS:
+                session.run(
+                    f"CREATE CONSTRAINT {name} IF NOT EXISTS "
+                    f"FOR (n:{label}) REQUIRE n.{prop} IS UNIQUE"
+                ).consume()
 
 def get_neo4j_client() -> Neo4jClient:
     return Neo4jClient()
\ No newline at end of file
@@ -1,129 +1,275 @@
+import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, BackgroundTasks, Query, HTTPException
+from datetime import datetime
+from fastapi import FastAPI, Query, HTTPException, Request, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from models.schemas import (
     ABTestGroup, LikeRequest, RecommendationResponse, 
     ABTestCounts, HealthResponse
 )
-from services.ab_test_service import get_ab_test_service
-from services.recommendation_service import get_recommendation_service
+from services.ab_test_service import ABTestService, get_ab_test_service
+from services.recommendation_service import RecommendationService, get_recommendation_service
 from services.gnn_service import get_gnn_service
-from services.data_sync_service import get_data_sync_service
-from database.neo4j_client import get_neo4j_client
+from services.data_sync_service import DataSyncService, get_data_sync_service
+from services.graph_service import GraphService, get_graph_service
+from database.neo4j_client import Neo4jClient, get_neo4j_client
 from config.settings import get_settings
 
-# Initialize services
-ab_test_service = get_ab_test_service()
-recommendation_service = get_recommendation_service()
-gnn_service = get_gnn_service()
-neo4j_client = get_neo4j_client()
-data_sync_service = get_data_sync_service()
 settings = get_settings()
+RETRAIN_LIKE_THRESHOLD = settings.retrain_like_threshold
+
+# Application loggers propagate to the root logger; uvicorn only configures its own
+logging.basicConfig(
+    level=settings.log_level,
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
 
 # Scheduler for background tasks
 scheduler = AsyncIOScheduler()
 
 
-def scheduled_sync_job():
+def flush_ab_counts_job(ab_test_service):
+    """Background job to persist in-memory A/B test counts."""
+    try:
+        ab_test_service.flush_counts()
+    except Exception as e:
+        logger.error("A/B count flush error: %s", e)
+
+
+async def scheduled_sync_job(data_sync_service):
     """Background job for scheduled data sync."""
     try:
-        data_sync_service.run_scheduled_sync()
+        await data_sync_service.run_scheduled_sync()
     except Exception as e:
-        print(f"✗ Scheduled sync error: {e}")
+        logger.error("Scheduled sync error: %s", e)
+
+
+def refresh_scores_job(recommendation_service):
+    """Background job to precompute note arrays and per-note scores."""
+    try:
+        recommendation_service.refresh_scores()
+    except Exception as e:
+        logger.error("Score refresh error: %s", e)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events."""
     # Startup
-    print("Starting Note Recommendation API...")
-    print("Checking Neo4j connection...")
+    logger.info("Starting Note Recommendation API...")
+    
+    # Initialize services once per process
+    app.state.neo4j_client = neo4j_client = get_neo4j_client()
+    app.state.ab_test_service = ab_test_service = get_ab_test_service()
+    app.state.graph_service = get_graph_service()
+    app.state.gnn_service = get_gnn_service()
+    app.state.recommendation_service = recommendation_service = get_recommendation_service()
+    app.state.data_sync_service = data_sync_service = get_data_sync_service()
+    app.state.likes_since_retrain = 0
     
-    if neo4j_client.verify_connectivity():
-        print("✓ Neo4j connected successfully")
+    # Persist A/B test counts periodically instead of on every like
+    scheduler.add_job(
+        flush_ab_counts_job,
+        'interval',
+        args=[ab_test_service],
+        seconds=settings.ab_test_counts_flush_seconds,
+        id='ab_counts_flush',
+        coalesce=True,
+        max_instances=1,
+        replace_existing=True
+    )
+    
+    # Own every rebuild of the note arrays and score vectors; requests only read
+    # them. Scheduled unconditionally so a late-arriving Neo4j still gets picked up
+    scheduler.add_job(
+        refresh_scores_job,
+        'interval',
+        args=[recommendation_service],
+        seconds=settings.score_refresh_seconds,
+        id='score_refresh',
+        coalesce=True,
+        max_instances=1,
+        replace_existing=True
+    )
+    
+    logger.info("Checking Neo4j connection...")
+    
+    if await neo4j_client.verify_connectivity_async():
+        logger.info("Neo4j connected successfully")
+        
+        try:
+            neo4j_client.ensure_constraints()
+            logger.info("Neo4j constraints ensured")
+        except Exception as e:
+            logger.error("Failed to create Neo4j constraints: %s", e)
         
         # Run initial data sync
-        print("\nRunning initial data sync...")
+        logger.info("Running initial data sync...")
+        count = 0
         try:
-            count = data_sync_service.sync_notes()
-            print(f"✓ Initial sync completed: {count} notes")
+            count = await data_sync_service.sync_notes_async()
+            logger.info("Initial sync completed: %d notes", count)
         except Exception as e:
-            print(f"✗ Initial sync failed: {e}")
+            logger.error("Initial sync failed: %s", e)
+        
+        # A sync that wrote notes already refreshed the GDS projection
+        if not count:
+            data_sync_service.graph_service.refresh_recommendation_graph()
         
         # Schedule hourly sync
         scheduler.add_job(
             scheduled_sync_job,
             'interval',
+            args=[data_sync_service],
             hours=settings.sync_interval_hours,
             id='hourly_sync',
             replace_existing=True
         )
-        scheduler.start()
-        print(f"✓ Scheduled hourly sync (every {settings.sync_interval_hours} hour(s))")
+        
+        # Schedule batched model retraining; /like can pull the next run forward
+        scheduler.add_job(
+            retrain_model_task,
+            'interval',
+            args=[app.state],
+            hours=settings.retrain_interval_hours,
+            id='model_retrain',
+            coalesce=True,
+            max_instances=1,
+            replace_existing=True
+        )
+        logger.info("Scheduled hourly sync (every %d hour(s))", settings.sync_interval_hours)
+        logger.info(
+            "Scheduled model retrain (every %d hour(s) or %d likes)",
+            settings.retrain_interval_hours, settings.retrain_like_threshold
+        )
     else:
-        print("✗ Warning: Neo4j connection failed")
+        logger.warning("Neo4j connection failed")
+    
+    scheduler.start()
     
     yield
     
     # Shutdown
     scheduler.shutdown(wait=False)
-    neo4j_client.close()
-    print("Application shutdown complete")
+    ab_test_service.flush_counts()
+    await data_sync_service.external_api.close_async()
+    await neo4j_client.close_async()
+    logger.info("Application shutdown complete")
 
 
 app = FastAPI(
     title="Note Recommendation API",
     version="2.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
 
-def retrain_model_task():
-    """Background task to retrain GNN model"""
+def retrain_model_task(state):
+    """Background job to retrain GNN model on accumulated likes"""
+    state.likes_since_retrain = 0
     try:
         # Load likes data
-        import json
-        
-        with open(settings.ab_test_data_path, 'r') as f:
-            likes_data = json.load(f)
+        likes_data = state.ab_test_service.load_likes_data()
         
         # Train model with likes data
-        gnn_service.train_model(likes_data)
-        print("Model retrained successfully")
+        state.gnn_service.train_model(likes_data)
+        logger.info("Model retrained successfully")
     except Exception as e:
-        print(f"Error retraining model: {e}")
+        logger.exception("Error retraining model: %s", e)
+
+
+# Dependency providers for the services created in lifespan
+def provide_neo4j_client(request: Request) -> Neo4jClient:
+    return request.app.state.neo4j_client
+
+
+def provide_ab_test_service(request: Request) -> ABTestService:
+    return request.app.state.ab_test_service
+
+
+def provide_graph_service(request: Request) -> GraphService:
+    return request.app.state.graph_service
+
+
+def provide_recommendation_service(request: Request) -> RecommendationService:
+    return request.app.state.recommendation_service
+
+
+def provide_data_sync_service(request: Request) -> DataSyncService:
+    return request.app.state.data_sync_service
+
+
+async def record_like_tx(tx, user_id: str, note_id: str):
+    """
+    Transaction function for /like; retried by the driver on transient errors.
+    Returns True if the Note did not exist yet (it is then missing from the GDS projection).
+    """
+    result = await tx.run(
+        """
+        MERGE (u:User {user_id: $user_id})
+        WITH u
+        OPTIONAL MATCH (existing:Note {note_id: $note_id})
+        MERGE (n:Note {note_id: $note_id})
+          ON CREATE SET n.like_count = 0
+        MERGE (u)-[:LIKED]->(n)
+          ON CREATE SET n.like_count = COALESCE(n.like_count, 0) + 1
+        RETURN existing IS NULL AS note_created
+        """,
+        user_id=user_id,
+        note_id=note_id
+    )
+    record = await result.single()
+    return bool(record and record["note_created"])
 
 
 @app.post("/like")
 async def like_note(
-    background_tasks: BackgroundTasks,
+    request: Request,
     user_id: str = Query(..., description="User UUID"),
     note_id: str = Query(..., description="Note UUID"),
-    ab_test: ABTestGroup = Query(..., description="A/B test group")
+    ab_test: ABTestGroup = Query(..., description="A/B test group"),
+    neo4j_client: Neo4jClient = Depends(provide_neo4j_client),
+    ab_test_service: ABTestService = Depends(provide_ab_test_service),
+    graph_service: GraphService = Depends(provide_graph_service),
+    recommendation_service: RecommendationService = Depends(provide_recommendation_service)
 ):
     """
     Record a like and update A/B test counts
-    Triggers weekly model retraining in background
+    Triggers model retraining once enough likes have accumulated
     """
+    state = request.app.state
     try:
         # Record like in Neo4j
-        with neo4j_client.get_session() as session:
-            session.run(
-                """
-                MATCH (u:User {user_id: $user_id})
-                MATCH (n:Note {note_id: $note_id})
-                MERGE (u)-[:LIKED]->(n)
-                SET n.like_count = COALESCE(n.like_count, 0) + 1
-                """,
-                user_id=user_id,
-                note_id=note_id
+        async with neo4j_client.get_async_session() as session:
+            note_created = await session.execute_write(record_like_tx, user_id, note_id)
+        
+        if note_created:
+            # PageRank cannot seed from a note outside the projection; rebuild it once
+            # in the background (bursts of new notes coalesce into one pending job)
+            graph_service.mark_projection_stale()
+            scheduler.add_job(
+                graph_service.refresh_recommendation_graph,
+                id='gds_refresh',
+                replace_existing=True
             )
         
         # Record in A/B test service
         ab_test_service.record_like(user_id, note_id, ab_test)
         
-        # Schedule background model retraining (weekly logic can be added)
-        background_tasks.add_task(retrain_model_task)
+        # The user's cached feed and the note's cached like_count are now stale
+        recommendation_service.invalidate_user(user_id)
+        graph_service.invalidate_note_features([note_id])
+        
+        # Retrain in batches rather than on every like
+        state.likes_since_retrain += 1
+        if state.likes_since_retrain >= RETRAIN_LIKE_THRESHOLD:
+            retrain_job = scheduler.get_job('model_retrain')
+            if retrain_job:
+                retrain_job.modify(next_run_time=datetime.now())
         
         return {
             "status": "success",
@@ -138,7 +284,8 @@ async def like_note(
 
 @app.get("/recommend", response_model=RecommendationResponse)
 async def recommend_notes(
-    user_id: str = Query(..., description="User UUID")
+    user_id: str = Query(..., description="User UUID"),
+    recommendation_service: RecommendationService = Depends(provide_recommendation_service)
 ):
     """
     Get personalized note recommendations.
@@ -147,7 +294,14 @@ async def recommend_notes(
     """
     try:
         # Get recommendations (returns list of note_ids)
-        note_ids = recommendation_service.get_recommendations(user_id, limit=10)
+        note_ids = recommendation_service.get_cached_recommendations(user_id, limit=10)
+        if note_ids is None:
+            # Scoring uses the sync driver and torch; keep it off the event loop
+            note_ids = await run_in_threadpool(
+                recommendation_service.get_recommendations,
+                user_id,
+                limit=10
+            )
         
         return RecommendationResponse(
             user_id=user_id,
@@ -159,10 +313,10 @@ async def recommend_notes(
 
 
 @app.post("/sync")
-async def trigger_sync():
+async def trigger_sync(data_sync_service: DataSyncService = Depends(provide_data_sync_service)):
     """Manually trigger data synchronization."""
     try:
-        count = data_sync_service.sync_notes()
+        count = await data_sync_service.sync_notes_async()
         return {
             "status": "success",
             "message": f"Synced {count} notes to Neo4j"
@@ -171,30 +325,31 @@ async def trigger_sync():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/ab_test_counts", response_model=ABTestCounts)
-async def get_ab_test_counts():
+# The following endpoints return plain dicts that already match their schema;
+# the schema is kept for the OpenAPI docs but skipped for response validation.
+@app.get("/ab_test_counts", response_model=None, responses={200: {"model": ABTestCounts}})
+async def get_ab_test_counts(ab_test_service: ABTestService = Depends(provide_ab_test_service)):
     """Get current A/B test like counts"""
     try:
-        counts = ab_test_service.get_counts()
-        return ABTestCounts(**counts)
+        return ab_test_service.get_counts()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/healthy", response_model=HealthResponse)
-async def health_check():
+@app.get("/healthy", response_model=None, responses={200: {"model": HealthResponse}})
+async def health_check(neo4j_client: Neo4jClient = Depends(provide_neo4j_client)):
     """Health check endpoint"""
     try:
         # Check Neo4j connectivity
-        is_connected = neo4j_client.verify_connectivity()
+        is_connected = await neo4j_client.verify_connectivity_async()
         
         if is_connected:
-            return HealthResponse(success="running")
+            return {"success": "running", "failure": None}
         else:
-            return HealthResponse(failure="internal error!")
+            return {"success": None, "failure": "internal error!"}
     
     except Exception:
-        return HealthResponse(failure="internal error!")
+        return {"success": None, "failure": "internal error!"}
 
 
 if __name__ == "__main__":
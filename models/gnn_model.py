@@ -1,3 +1,5 @@
+import contextlib
+from typing import Optional
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -8,29 +10,59 @@ class GATRecommender(nn.Module):
     Graph Attention Network for note recommendation.
     Architecture: 2-layer GAT with 4 attention heads.
     """
-    def __init__(self, in_channels: int = 3, hidden_channels: int = 32, out_channels: int = 16, heads: int = 4):
+    def __init__(
+        self,
+        in_channels: int = 2,
+        hidden_channels: int = 32,
+        out_channels: int = 16,
+        heads: int = 4,
+        num_categories: int = 1,
+        category_dim: int = 4,
+        device: Optional[torch.device] = None,
+        dtype: Optional[torch.dtype] = None
+    ):
         super(GATRecommender, self).__init__()
         
+        # Run on GPU when available; inference uses bfloat16 there, float32 on CPU
+        self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.inference_dtype = dtype or (torch.bfloat16 if self.device.type == "cuda" else torch.float32)
+        
+        # Self-loops are added once by the caller when the graph is built,
+        # so the layers do not re-add them on every forward pass
+        
+        # Learned category vectors, concatenated to the numeric node features
+        self.category_embedding = nn.Embedding(num_categories, category_dim)
+        
         # First GAT layer
-        self.conv1 = GATConv(in_channels, hidden_channels, heads=heads, dropout=0.2)
+        self.conv1 = GATConv(in_channels + category_dim, hidden_channels, heads=heads, dropout=0.2, add_self_loops=False)
         
         # Second GAT layer
-        self.conv2 = GATConv(hidden_channels * heads, out_channels, heads=1, concat=False, dropout=0.2)
+        self.conv2 = GATConv(
+            hidden_channels * heads, out_channels, heads=1, concat=False, dropout=0.2, add_self_loops=False
+        )
         
         # Output layer for scoring
         self.score_layer = nn.Linear(out_channels, 1)
+        
+        # Parameters stay float32 so training and checkpoints are unaffected
+        self.to(self.device)
+        self._compiled_forward = None
+        self._compiled_score = None
     
-    def forward(self, x: torch.Tensor, edge_index: torch.Tensor) -> torch.Tensor:
+    def forward(self, x: torch.Tensor, edge_index: torch.Tensor, category_idx: torch.Tensor) -> torch.Tensor:
         """
         Forward pass through the GAT layers.
         
         Args:
             x: Node features [num_nodes, in_channels]
-            edge_index: Graph connectivity [2, num_edges]
+            edge_index: Graph connectivity [2, num_edges], including self-loops
+            category_idx: Category ids [num_nodes] (long)
         
         Returns:
             Node embeddings [num_nodes, out_channels]
         """
+        x = torch.cat([x, self.category_embedding(category_idx)], dim=-1)
+        
         # First GAT layer with ELU activation
         x = self.conv1(x, edge_index)
         x = F.elu(x)
@@ -41,19 +73,80 @@ class GATRecommender(nn.Module):
         
         return x
     
-    def predict_score(self, x: torch.Tensor, edge_index: torch.Tensor) -> torch.Tensor:
+    def compute_embeddings(
+        self, x: torch.Tensor, edge_index: torch.Tensor, category_idx: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Compute node embeddings for inference.
+        
+        Args:
+            x: Node features [num_nodes, in_channels]
+            edge_index: Graph connectivity [2, num_edges]
+            category_idx: Category ids [num_nodes] (long)
+        
+        Returns:
+            Node embeddings [num_nodes, out_channels]
+        """
+        self.eval()
+        with torch.inference_mode(), self._autocast():
+            return self._inference_forward()(
+                x.to(self.device), edge_index.to(self.device), category_idx.to(self.device)
+            )
+    
+    def score(self, embeddings: torch.Tensor) -> torch.Tensor:
+        """
+        Score precomputed node embeddings.
+        
+        Args:
+            embeddings: Node embeddings [num_nodes, out_channels]
+        
+        Returns:
+            Scores [num_nodes] in range [0, 1]
+        """
+        with torch.inference_mode(), self._autocast():
+            return self._inference_score()(embeddings)
+    
+    def predict_score(
+        self, x: torch.Tensor, edge_index: torch.Tensor, category_idx: torch.Tensor
+    ) -> torch.Tensor:
         """
         Predict recommendation scores for nodes.
         
         Args:
             x: Node features [num_nodes, in_channels]
             edge_index: Graph connectivity [2, num_edges]
+            category_idx: Category ids [num_nodes] (long)
         
         Returns:
             Scores [num_nodes] in range [0, 1]
         """
-        self.eval()
-        with torch.no_grad():
-            embeddings = self.forward(x, edge_index)
-            scores = torch.sigmoid(self.score_layer(embeddings)).squeeze(-1)
-        return scores
\ No newline at end of file
+        return self.score(self.compute_embeddings(x, edge_index, category_idx))
+    
+    def _autocast(self):
+        """Reduced-precision context for inference (no-op for float32)"""
+        if self.inference_dtype == torch.float32:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=self.device.type, dtype=self.inference_dtype)
+    
+    def _inference_forward(self):
+        """Forward pass used for inference; compiled once on CUDA"""
+        if self.device.type != "cuda":
+            return self.forward
+        if self._compiled_forward is None:
+            self._compiled_forward = torch.compile(self.forward, mode="reduce-overhead")
+        return self._compiled_forward
+    
+    def logits(self, embeddings: torch.Tensor) -> torch.Tensor:
+        """Unnormalized scores [num_nodes]; used directly as the training target"""
+        return self.score_layer(embeddings).squeeze(-1)
+    
+    def _score_head(self, embeddings: torch.Tensor) -> torch.Tensor:
+        return torch.sigmoid(self.logits(embeddings))
+    
+    def _inference_score(self):
+        """Linear + sigmoid scoring head; compiled once on CUDA into a single fused kernel"""
+        if self.device.type != "cuda":
+            return self._score_head
+        if self._compiled_score is None:
+            self._compiled_score = torch.compile(self._score_head, dynamic=True)
+        return self._compiled_score
\ No newline at end of file
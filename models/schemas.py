@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional
 from datetime import datetime
 from enum import Enum
@@ -16,6 +16,8 @@ class LikeRequest(BaseModel):
 
 
 class LikeRecord(BaseModel):
+    model_config = ConfigDict(extra='ignore', frozen=True)
+    
     user_id: str
     note_id: str
     ab_group: ABTestGroup
@@ -25,6 +27,8 @@ class LikeRecord(BaseModel):
 
 class NoteFromAPI(BaseModel):
     """Schema for notes fetched from external API."""
+    model_config = ConfigDict(extra='ignore', frozen=True)
+    
     id: str
     title: str
     shortDescription: Optional[str] = None
@@ -0,0 +1,52 @@
+"""
+Hybrid score kernel.
+
+Compiled with Numba when it is installed; otherwise the same combination
+is evaluated as a NumPy expression. Both write into a caller-provided
+float32 output array.
+"""
+import numpy as np
+
+try:
+    from numba import njit
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
+
+GRAPH_BOOST_SCALE = 0.1
+GRAPH_BOOST_CAP = 0.3
+
+
+def _hybrid_score_numpy(gat, trad, rec, rand, graph, w_gat, w_trad, w_rec, w_rand, out):
+    np.multiply(graph, GRAPH_BOOST_SCALE, out=out)
+    np.minimum(out, GRAPH_BOOST_CAP, out=out)
+    out += w_gat * gat
+    out += w_trad * trad
+    out += w_rec * rec
+    out += w_rand * rand
+    return out
+
+
+if _NUMBA_AVAILABLE:
+    # Single-threaded on purpose: requests already run concurrently on the
+    # threadpool, and parallel regions launched from several threads at once
+    # oversubscribe the cores (or abort under the workqueue threading layer)
+    @njit(fastmath=True, cache=True)
+    def hybrid_score(gat, trad, rec, rand, graph, w_gat, w_trad, w_rec, w_rand, out):
+        for i in range(gat.shape[0]):
+            out[i] = (
+                w_gat * gat[i] +
+                w_trad * trad[i] +
+                w_rec * rec[i] +
+                w_rand * rand[i] +
+                min(graph[i] * GRAPH_BOOST_SCALE, GRAPH_BOOST_CAP)
+            )
+        return out
+    
+    # Compile once at import so the first request does not pay for it
+    _warmup = np.zeros(8, dtype=np.float32)
+    hybrid_score(_warmup, _warmup, _warmup, _warmup, _warmup, 0.35, 0.35, 0.15, 0.15, np.empty_like(_warmup))
+    del _warmup
+else:
+    hybrid_score = _hybrid_score_numpy
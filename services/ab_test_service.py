@@ -1,6 +1,9 @@
-import json
+import orjson
 import os
+import threading
 from datetime import datetime
+from functools import lru_cache
+from time import time_ns
 from pathlib import Path
 from models.schemas import ABTestGroup, LikeRecord, ABTestCounts
 from config.settings import get_settings
@@ -8,70 +11,110 @@ from config.settings import get_settings
 class ABTestService:
     def __init__(self):
         self.settings = get_settings()
+        self._likes_path = self.settings.ab_test_data_path
+        self._counts_path = self.settings.ab_test_counts_path
         self._ensure_data_directory()
         self._initialize_counts_file()
+        
+        # Counts are kept in memory and flushed to disk periodically
+        self._lock = threading.Lock()
+        self._counts = self._load_counts()
+        self._counts_dirty = False
+        
+        # (epoch second, datetime, ISO string) reused for likes within the same second
+        self._ts_cache = (None, None, None)
     
     def _ensure_data_directory(self):
         Path("data").mkdir(exist_ok=True)
     
     def _initialize_counts_file(self):
-        if not os.path.exists(self.settings.ab_test_counts_path):
+        if not os.path.exists(self._counts_path):
             initial_data = {
                 "ab_test_a_like_count": 0,
                 "ab_test_b_like_count": 0,
                 "last_updated": datetime.now().isoformat()
             }
-            with open(self.settings.ab_test_counts_path, 'w') as f:
-                json.dump(initial_data, f, indent=2)
+            self._write_counts(initial_data)
+    
+    def _now(self) -> tuple:
+        """Current time at second resolution as (datetime, ISO string), cached per second."""
+        second = time_ns() // 1_000_000_000
+        cached = self._ts_cache
+        if cached[0] != second:
+            now = datetime.fromtimestamp(second)
+            cached = (second, now, now.isoformat())
+            self._ts_cache = cached
+        return cached[1], cached[2]
     
     def record_like(self, user_id: str, note_id: str, ab_group: ABTestGroup):
+        now, now_iso = self._now()
+        
         # Record individual like
         like_record = LikeRecord(
             user_id=user_id,
             note_id=note_id,
             ab_group=ab_group,
-            timestamp=datetime.now(),
+            timestamp=now,
             liked_note_id=note_id
         )
         
-        # Append to likes file
-        likes_data = self._load_likes_data()
-        likes_data.append(like_record.model_dump(mode='json'))
-        self._save_likes_data(likes_data)
+        # Append to likes log (one JSON record per line)
+        with open(self._likes_path, 'a', buffering=1) as f:
+            f.write(like_record.model_dump_json() + "\n")
         
         # Update counts
-        self._increment_count(ab_group)
+        self._increment_count(ab_group, now_iso)
     
-    def _load_likes_data(self) -> list:
-        if not os.path.exists(self.settings.ab_test_data_path):
+    def load_likes_data(self) -> list:
+        """Stream all like records from the JSON Lines log."""
+        if not os.path.exists(self._likes_path):
             return []
         
-        with open(self.settings.ab_test_data_path, 'r') as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return []
+        likes_data = []
+        with open(self._likes_path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    likes_data.append(orjson.loads(line))
+                except orjson.JSONDecodeError:
+                    continue
+        return likes_data
     
-    def _save_likes_data(self, data: list):
-        with open(self.settings.ab_test_data_path, 'w') as f:
-            json.dump(data, f, indent=2)
+    def _load_counts(self) -> dict:
+        with open(self._counts_path, 'rb') as f:
+            return orjson.loads(f.read())
     
-    def _increment_count(self, ab_group: ABTestGroup):
-        counts = self.get_counts()
-        
-        if ab_group == ABTestGroup.A:
-            counts["ab_test_a_like_count"] += 1
-        else:
-            counts["ab_test_b_like_count"] += 1
-        
-        counts["last_updated"] = datetime.now().isoformat()
+    def _increment_count(self, ab_group: ABTestGroup, timestamp: str):
+        with self._lock:
+            if ab_group == ABTestGroup.A:
+                self._counts["ab_test_a_like_count"] += 1
+            else:
+                self._counts["ab_test_b_like_count"] += 1
+            
+            self._counts["last_updated"] = timestamp
+            self._counts_dirty = True
+    
+    def flush_counts(self):
+        """Persist in-memory counts to disk if they changed since the last flush."""
+        with self._lock:
+            if not self._counts_dirty:
+                return
+            counts = dict(self._counts)
+            self._counts_dirty = False
         
-        with open(self.settings.ab_test_counts_path, 'w') as f:
-            json.dump(counts, f, indent=2)
+        self._write_counts(counts)
+    
+    def _write_counts(self, counts: dict):
+        """Replace the counts file atomically so a crash mid-write never leaves it truncated."""
+        tmp_path = f"{self._counts_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(counts, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, self._counts_path)
     
     def get_counts(self) -> dict:
-        with open(self.settings.ab_test_counts_path, 'r') as f:
-            return json.load(f)
+        with self._lock:
+            return dict(self._counts)
     
     def get_winning_group(self) -> ABTestGroup:
         counts = self.get_counts()
@@ -85,5 +128,6 @@ class ABTestService:
         else:
             return ABTestGroup.B
 
+@lru_cache()
 def get_ab_test_service() -> ABTestService:
     return ABTestService()
\ No newline at end of file
@@ -2,10 +2,26 @@
 Data Sync Service
 Handles synchronization of external API data to Neo4j graph database.
 """
-from typing import Optional
+import asyncio
+import logging
+from typing import Optional, List, Dict, Any
+from pydantic import TypeAdapter, ValidationError
+from models.schemas import NoteFromAPI
+from config.settings import get_settings
 from services.external_api_service import get_external_api_service
 from services.graph_service import get_graph_service
 
+logger = logging.getLogger(__name__)
+
+# Validates a whole page of notes in one pydantic-core call
+_notes_adapter = TypeAdapter(List[NoteFromAPI])
+
+
+def _chunked(items: list, size: int):
+    """Yield successive slices of at most `size` items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
 
 class DataSyncService:
     """Service for syncing external API data to Neo4j."""
@@ -22,68 +38,105 @@ class DataSyncService:
         if self._initialized:
             return
         
+        self.settings = get_settings()
+        self._batch_size = self.settings.sync_batch_size
+        self._concurrency = self.settings.sync_concurrency
         self.external_api = get_external_api_service()
         self.graph_service = get_graph_service()
         self._initialized = True
     
-    def sync_notes(self) -> int:
+    async def sync_notes_async(self) -> int:
         """
-        Fetch all notes from external API and sync to Neo4j.
+        Fetch all notes from external API and sync to Neo4j, overlapping the
+        batch writes on the event loop.
         Returns the number of notes synced.
         """
-        print("Starting note synchronization...")
+        logger.info("Starting note synchronization...")
         
-        # Fetch notes from external API
-        notes = self.external_api.get_all_notes()
+        raw_notes = await self.external_api.get_all_notes_async()
         
-        if not notes:
-            print("✗ No notes to sync")
+        if not raw_notes:
+            logger.warning("No notes to sync")
             return 0
         
-        synced_count = 0
+        notes = self._validate_notes(raw_notes)
+        batches, users_synced = self._plan_batches(notes)
+        
+        semaphore = asyncio.Semaphore(self._concurrency)
+        
+        async def bounded(coro):
+            async with semaphore:
+                return await coro
+        
+        # Nodes first, then relationships: a CREATED link may point at a user
+        # written by a different batch, so links wait for every node batch.
+        node_writes = []
+        for batch, creators, _ in batches:
+            node_writes.append(bounded(self.graph_service.upsert_notes_batch_async(batch)))
+            node_writes.append(bounded(self.graph_service.upsert_users_batch_async(creators)))
+        results = await asyncio.gather(*node_writes)
+        synced_count = sum(results[0::2])
+        
+        await asyncio.gather(*(
+            bounded(self.graph_service.link_creators_batch_async(links))
+            for _, _, links in batches
+        ))
+        
+        logger.info("Synced %d notes and %d users to Neo4j", synced_count, users_synced)
+        if synced_count:
+            await asyncio.to_thread(self.graph_service.refresh_recommendation_graph)
+        return synced_count
+    
+    def _plan_batches(self, notes: List[NoteFromAPI]) -> tuple:
+        """
+        Split notes into write batches of (notes, new creators, CREATED links).
+        Each creator is written once, in the first batch that references it.
+        Returns (batches, number of distinct creators).
+        """
+        batches = []
         users_synced = set()
         
-        for note in notes:
-            try:
-                # Upsert the note
-                if self.graph_service.upsert_note(note):
-                    synced_count += 1
-                
-                # Upsert the creator user
-                creator = note.get("creatorAppUser", {})
+        for batch in _chunked(notes, self._batch_size):
+            creators = []
+            links = []
+            
+            for note in batch:
+                creator = note.creatorAppUser
                 if creator and creator.get("id"):
                     user_id = creator.get("id")
                     
                     if user_id not in users_synced:
-                        self.graph_service.upsert_user(creator)
+                        creators.append(creator)
                         users_synced.add(user_id)
                     
-                    # Create relationship
-                    self.graph_service.create_user_created_note(
-                        user_id=user_id,
-                        note_id=note.get("id")
-                    )
+                    links.append({"user_id": user_id, "note_id": note.id})
             
-            except Exception as e:
-                print(f"✗ Error syncing note {note.get('id')}: {e}")
-                continue
+            batches.append((batch, creators, links))
         
-        print(f"✓ Synced {synced_count} notes and {len(users_synced)} users to Neo4j")
-        return synced_count
+        return batches, len(users_synced)
+    
+    def _validate_notes(self, raw_notes: List[Dict[str, Any]]) -> List[NoteFromAPI]:
+        """Validate raw API notes in bulk, dropping any that fail validation."""
+        try:
+            return _notes_adapter.validate_python(raw_notes)
+        except ValidationError as e:
+            invalid = {error["loc"][0] for error in e.errors() if error["loc"]}
+            logger.warning("Skipping %d invalid notes", len(invalid))
+            return _notes_adapter.validate_python(
+                [note for i, note in enumerate(raw_notes) if i not in invalid]
+            )
     
-    def run_scheduled_sync(self):
+    async def run_scheduled_sync(self):
         """
-        Scheduled sync task for APScheduler.
+        Scheduled sync task for APScheduler, run on the event loop.
         """
-        print("\n" + "="*50)
-        print("Running scheduled data sync...")
-        print("="*50)
+        logger.info("Running scheduled data sync...")
         
         try:
-            count = self.sync_notes()
-            print(f"Scheduled sync completed: {count} notes")
+            count = await self.sync_notes_async()
+            logger.info("Scheduled sync completed: %d notes", count)
         except Exception as e:
-            print(f"✗ Scheduled sync failed: {e}")
+            logger.error("Scheduled sync failed: %s", e)
 
 
 # Singleton accessor
@@ -2,11 +2,19 @@
 External API Service
 Handles authentication and data fetching from the external note API.
 """
+import asyncio
+import logging
+import math
+import os
 import httpx
-from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any
+import orjson
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple
 from config.settings import get_settings
 
+logger = logging.getLogger(__name__)
+
 
 class ExternalAPIService:
     """Service for interacting with external note API."""
@@ -27,12 +35,51 @@ class ExternalAPIService:
         self._access_token: Optional[str] = None
         self._token_expiration: Optional[datetime] = None
         self._user_id: Optional[str] = None
+        self._page_size = self.settings.external_api_page_size
+        self._page_concurrency = self.settings.external_api_page_concurrency
+        
+        # Only one caller logs in when the token expires; the rest reuse its token
+        self._async_login_lock: Optional[asyncio.Lock] = None
+        
+        # One long-lived client so login and fetches reuse keep-alive connections.
+        # It is bound to the running event loop, so it is created lazily
+        self._async_client: Optional[httpx.AsyncClient] = None
+        
+        self._token_cache_path = Path(self.settings.external_api_token_cache_path).expanduser()
+        self._load_cached_token()
         self._initialized = True
     
     @property
     def base_url(self) -> str:
         return self.settings.external_api_base_url
     
+    def _client_options(self) -> Dict[str, Any]:
+        """Connection settings for the HTTP client."""
+        return {
+            "base_url": self.base_url,
+            "timeout": httpx.Timeout(60.0),
+            "limits": httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            # Bodies are encoded with orjson and sent as raw content, so set the type here
+            "headers": {"Content-Type": "application/json"},
+            # Concurrent requests multiplex over one connection instead of opening one each
+            "http2": True,
+            # System trust store by default; point at a CA bundle for a privately signed API
+            "verify": self.settings.external_api_ca_bundle or True
+        }
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._client_options())
+            if self._access_token:
+                self._async_client.headers["Authorization"] = f"Bearer {self._access_token}"
+        return self._async_client
+    
+    async def close_async(self):
+        """Close the async HTTP connection pool, if one was opened."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+    
     def _is_token_valid(self) -> bool:
         """Check if current token is still valid."""
         if not self._access_token or not self._token_expiration:
@@ -40,118 +87,206 @@ class ExternalAPIService:
         
         # Add 5 minute buffer for safety
         now = datetime.now(timezone.utc)
-        return now < self._token_expiration
+        return now + timedelta(minutes=5) < self._token_expiration
+    
+    def _load_cached_token(self):
+        """Restore a token persisted by a previous process, if it is still valid."""
+        try:
+            with open(self._token_cache_path, 'rb') as f:
+                cached = orjson.loads(f.read())
+            # A token issued by another API or for another account is of no use here
+            if cached.get("base_url") != self.base_url or cached.get("email") != self.settings.external_api_email:
+                return
+            self._access_token = cached["access_token"]
+            self._user_id = cached.get("user_id")
+            self._token_expiration = datetime.fromisoformat(cached["expiration"])
+        except (OSError, AttributeError, KeyError, TypeError, ValueError):
+            return
+        
+        if not self._is_token_valid():
+            self._access_token = self._token_expiration = self._user_id = None
+    
+    def _save_cached_token(self):
+        """Persist the current token atomically, readable by the owner only, so restarts can skip login."""
+        if not self._access_token or not self._token_expiration:
+            return
+        
+        payload = {
+            "base_url": self.base_url,
+            "email": self.settings.external_api_email,
+            "access_token": self._access_token,
+            "user_id": self._user_id,
+            "expiration": self._token_expiration.isoformat()
+        }
+        try:
+            self._token_cache_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            tmp_path = self._token_cache_path.with_suffix(".tmp")
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps(payload))
+            # The mode passed to os.open does not apply to a leftover temp file
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self._token_cache_path)
+        except OSError as e:
+            logger.warning("Could not persist external API token: %s", e)
+    
+    def _login_payload(self) -> Dict[str, Any]:
+        return {
+            "email": self.settings.external_api_email,
+            "password": self.settings.external_api_password
+        }
+    
+    def _apply_login_response(self, data: Dict[str, Any]) -> bool:
+        """Store the token from a login response. Returns True on success."""
+        if not data.get("meta", {}).get("isSuccess"):
+            logger.error("External API login failed: %s", data.get("meta", {}).get("message"))
+            return False
+        
+        entity = data.get("entity", {})
+        self._access_token = entity.get("accessToken")
+        self._user_id = entity.get("userId")
+        
+        if self._async_client is not None:
+            self._async_client.headers["Authorization"] = f"Bearer {self._access_token}"
+        
+        # Parse expiration date
+        exp_str = entity.get("accessTokenExpiration", "")
+        if exp_str:
+            # Handle ISO format with Z suffix
+            exp_str = exp_str.replace("Z", "+00:00")
+            self._token_expiration = datetime.fromisoformat(exp_str)
+        
+        self._save_cached_token()
+        logger.info("External API login successful (User: %s)", entity.get("username"))
+        return True
     
-    def login(self) -> bool:
+    async def login_async(self) -> bool:
         """
         Login to external API and store access token.
         Returns True if login successful.
         """
         try:
-            login_url = f"{self.base_url}/api/auth/login"
-            payload = {
-                "email": self.settings.external_api_email,
-                "password": self.settings.external_api_password
-            }
-            
-            with httpx.Client(timeout=30.0, verify=False) as client:
-                response = client.post(login_url, json=payload)
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                if data.get("meta", {}).get("isSuccess"):
-                    entity = data.get("entity", {})
-                    self._access_token = entity.get("accessToken")
-                    self._user_id = entity.get("userId")
-                    
-                    # Parse expiration date
-                    exp_str = entity.get("accessTokenExpiration", "")
-                    if exp_str:
-                        # Handle ISO format with Z suffix
-                        exp_str = exp_str.replace("Z", "+00:00")
-                        self._token_expiration = datetime.fromisoformat(exp_str)
-                    
-                    print(f"✓ External API login successful (User: {entity.get('username')})")
-                    return True
-                else:
-                    print(f"✗ External API login failed: {data.get('meta', {}).get('message')}")
-                    return False
-                    
+            client = self._get_async_client()
+            response = await client.post("/api/auth/login", content=orjson.dumps(self._login_payload()), timeout=30.0)
+            response.raise_for_status()
+            return self._apply_login_response(orjson.loads(response.content))
         except httpx.HTTPStatusError as e:
-            print(f"✗ External API login HTTP error: {e.response.status_code}")
+            logger.error("External API login HTTP error: %d", e.response.status_code)
             return False
         except Exception as e:
-            print(f"✗ External API login error: {e}")
+            logger.error("External API login error: %s", e)
             return False
     
-    def get_access_token(self) -> Optional[str]:
+    async def get_access_token_async(self) -> Optional[str]:
         """Get current access token, refreshing if necessary."""
         if not self._is_token_valid():
-            if not self.login():
-                return None
+            if self._async_login_lock is None:
+                self._async_login_lock = asyncio.Lock()
+            async with self._async_login_lock:
+                if not self._is_token_valid() and not await self.login_async():
+                    return None
         return self._access_token
     
-    def get_current_user_id(self) -> Optional[str]:
+    async def _refresh_rejected_token_async(self, rejected_token: Optional[str]) -> bool:
+        """
+        Log in again after the API rejected rejected_token with a 401.
+        Concurrent callers holding the same token share one login.
+        """
+        if self._async_login_lock is None:
+            self._async_login_lock = asyncio.Lock()
+        async with self._async_login_lock:
+            if self._access_token != rejected_token:
+                # Another caller already replaced it
+                return self._access_token is not None
+            self._access_token = self._token_expiration = None
+            return await self.login_async()
+    
+    async def get_current_user_id_async(self) -> Optional[str]:
         """Get the user ID of the logged-in user."""
-        if not self._is_token_valid():
-            self.login()
+        await self.get_access_token_async()
         return self._user_id
     
-    def get_all_notes(self) -> List[Dict[str, Any]]:
+    def _notes_page_payload(self, page_number: int) -> Dict[str, Any]:
+        return {
+            "pagingRequest": {
+                "pageNumber": page_number,
+                "pageSize": self._page_size
+            },
+            "minRating": 0,
+            "sortBy": 1,
+            "searchText": None,
+            "tagIds": [],
+            "lectureIds": [],
+            "languageIds": [],
+            "universityIds": []
+        }
+    
+    def _parse_notes_page(self, data: Dict[str, Any]) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        """Return (entities, total row count) for a getPage response, or None if it failed."""
+        if not data.get("meta", {}).get("isSuccess"):
+            logger.error("Failed to fetch notes: %s", data.get("meta", {}).get("message"))
+            return None
+        
+        entities = data.get("entities", [])
+        page_info = data.get("pageInfo", {})
+        return entities, page_info.get("totalRowCount", len(entities))
+    
+    def _page_count(self, total_count: int) -> int:
+        return max(math.ceil(total_count / self._page_size), 1)
+    
+    async def _fetch_page_async(self, page_number: int) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        content = orjson.dumps(self._notes_page_payload(page_number))
+        token = self._access_token
+        response = await self._get_async_client().post("/api/note/getPage", content=content)
+        if response.status_code == 401:
+            # Token revoked before its expiration: log in again and retry once
+            logger.info("External API rejected the access token, logging in again")
+            if await self._refresh_rejected_token_async(token):
+                response = await self._get_async_client().post("/api/note/getPage", content=content)
+        response.raise_for_status()
+        return self._parse_notes_page(orjson.loads(response.content))
+    
+    async def get_all_notes_async(self) -> List[Dict[str, Any]]:
         """
-        Fetch all notes from external API using getPage endpoint.
+        Fetch all notes from external API using getPage endpoint. The first page
+        gives the total row count; the remaining pages are then fetched concurrently.
         Returns list of note dictionaries.
         """
-        token = self.get_access_token()
+        token = await self.get_access_token_async()
         if not token:
-            print("✗ Cannot fetch notes: No valid token")
+            logger.error("Cannot fetch notes: no valid token")
             return []
         
         try:
-            url = f"{self.base_url}/api/note/getPage"
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "pagingRequest": {
-                    "pageNumber": 1,
-                    "pageSize": 2048
-                },
-                "minRating": 0,
-                "sortBy": 1,
-                "searchText": None,
-                "tagIds": [],
-                "lectureIds": [],
-                "languageIds": [],
-                "universityIds": []
-            }
-            
-            with httpx.Client(timeout=60.0, verify=False) as client:
-                response = client.post(url, json=payload, headers=headers)
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                if data.get("meta", {}).get("isSuccess"):
-                    entities = data.get("entities", [])
-                    page_info = data.get("pageInfo", {})
-                    total_count = page_info.get("totalRowCount", len(entities))
-                    
-                    print(f"✓ Fetched {len(entities)} notes (total: {total_count})")
-                    return entities
-                else:
-                    print(f"✗ Failed to fetch notes: {data.get('meta', {}).get('message')}")
-                    return []
-                    
+            first_page = await self._fetch_page_async(1)
         except httpx.HTTPStatusError as e:
-            print(f"✗ HTTP error fetching notes: {e.response.status_code}")
+            logger.error("HTTP error fetching notes: %d", e.response.status_code)
             return []
         except Exception as e:
-            print(f"✗ Error fetching notes: {e}")
+            logger.error("Error fetching notes: %s", e)
             return []
-
+        
+        if first_page is None:
+            return []
+        
+        notes, total_count = first_page
+        semaphore = asyncio.Semaphore(self._page_concurrency)
+        
+        async def bounded(page_number: int):
+            async with semaphore:
+                try:
+                    return await self._fetch_page_async(page_number)
+                except Exception as e:
+                    logger.error("Error fetching notes page %d: %s", page_number, e)
+                    return None
+        
+        pages = await asyncio.gather(*(bounded(p) for p in range(2, self._page_count(total_count) + 1)))
+        for page in pages:
+            if page is not None:
+                notes.extend(page[0])
+        
+        logger.info("Fetched %d notes (total: %d)", len(notes), total_count)
+        return notes
 
 # Singleton accessor
 _service_instance: Optional[ExternalAPIService] = None
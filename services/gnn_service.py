@@ -1,114 +1,281 @@
+import logging
+import threading
+import numpy as np
+import orjson
 import torch
 import torch.nn as nn
-from typing import List, Dict
+from safetensors import safe_open
+from safetensors.torch import load_model, save_model
+from torch_geometric.utils import add_self_loops
+from typing import List, Dict, Optional, Sequence, Tuple
 from models.gnn_model import GATRecommender
 from services.graph_service import get_graph_service
 from config.settings import get_settings
 from pathlib import Path
-import random
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _configure_torch_threads(num_threads: int):
+    """
+    Cap torch's CPU thread pools. Inference runs on small graphs from many
+    concurrent threadpool requests, so per-call OpenMP fan-out only
+    oversubscribes the cores.
+    """
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(num_threads)
+    except RuntimeError:
+        # Only settable before the first inter-op parallel work in the process
+        pass
+
+
+_configure_torch_threads(get_settings().torch_num_threads)
+
+# Per-column normalization for (log1p(view_count), tag_count).
+# like_count is deliberately not an input: training labels are derived from likes
+_FEATURE_SCALE = np.array([0.1, 0.1], dtype=np.float32)
+# Stored in checkpoint metadata; checkpoints trained on other inputs are not loaded
+_FEATURE_LAYOUT = "log1p_view_count,tag_count"
 
 class GNNService:
     def __init__(self):
         self.settings = get_settings()
-        self.model = GATRecommender()
         self.graph_service = get_graph_service()
-        self._load_or_initialize_model()
-    
-    def _load_or_initialize_model(self):
         checkpoint_path = Path(self.settings.model_checkpoint_path)
-        
-        if checkpoint_path.exists():
-            self.model.load_state_dict(torch.load(checkpoint_path, weights_only=True))
-            print(f"Model loaded from {checkpoint_path}")
+        metadata = self._read_checkpoint_metadata(checkpoint_path)
+        # Category -> embedding index, persisted with the checkpoint so indices never shift;
+        # the last index is reserved for categories the checkpoint has not seen
+        self._category_ids = self._checkpoint_vocabulary(metadata)
+        if self._category_ids is None:
+            self._category_ids = self._load_category_vocabulary()
+        self.model = GATRecommender(num_categories=len(self._category_ids) + 1)
+        # (node features, category ids, embeddings) from the last GAT forward pass
+        self._embedding_cache = None
+        # (num_nodes, edge_index with self-loops) for the last graph built
+        self._edge_cache = None
+        # Serializes inference against swapping in retrained weights
+        self._model_lock = threading.Lock()
+        self._load_or_initialize_model(checkpoint_path, metadata)
+    
+    def _load_or_initialize_model(self, checkpoint_path: Path, metadata: Optional[Dict[str, str]]):
+        if metadata is None:
+            logger.info("No checkpoint found, using randomly initialized model")
+        elif "categories" not in metadata or metadata.get("features") != _FEATURE_LAYOUT:
+            logger.warning("Checkpoint %s has no category vocabulary or a different feature layout, "
+                           "using randomly initialized model", checkpoint_path)
         else:
-            print("No checkpoint found, using randomly initialized model")
+            try:
+                # safetensors maps the file and loads tensors straight onto the model device;
+                # load_model restores the weights GATConv shares between lin_src and lin_dst
+                load_model(self.model, str(checkpoint_path), device=str(self.model.device))
+                logger.info("Model loaded from %s", checkpoint_path)
+            except RuntimeError as e:
+                # Checkpoint was written by a different model architecture
+                logger.warning("Checkpoint incompatible with current model, using randomly initialized model: %s", e)
+        
+        # Serving runs in eval mode; train_model trains a separate copy
+        self.model.eval()
     
-    def predict_scores(self, note_ids: List[str]) -> Dict[str, float]:
-        """Predict GNN scores for candidate notes"""
-        if not note_ids:
+    @staticmethod
+    def _read_checkpoint_metadata(checkpoint_path: Path) -> Optional[Dict[str, str]]:
+        """safetensors header metadata of the checkpoint, or None when there is no checkpoint"""
+        if not checkpoint_path.exists():
+            return None
+        try:
+            with safe_open(str(checkpoint_path), framework="pt") as f:
+                return f.metadata() or {}
+        except Exception as e:
+            logger.warning("Could not read checkpoint metadata from %s: %s", checkpoint_path, e)
             return {}
+    
+    @staticmethod
+    def _checkpoint_vocabulary(metadata: Optional[Dict[str, str]]) -> Optional[Dict[str, int]]:
+        """Category vocabulary saved with the checkpoint, or None if it has none"""
+        if not metadata or "categories" not in metadata or metadata.get("features") != _FEATURE_LAYOUT:
+            return None
+        try:
+            names = orjson.loads(metadata["categories"])
+        except orjson.JSONDecodeError:
+            return None
+        return {name: i for i, name in enumerate(names)}
+    
+    def _load_category_vocabulary(self) -> Dict[str, int]:
+        """Derive a vocabulary from the graph; only used until a checkpoint persists one"""
+        try:
+            names = self.graph_service.get_category_names()
+        except Exception as e:
+            logger.warning("Could not load category vocabulary: %s", e)
+            names = []
+        return {name: i for i, name in enumerate(names)}
+    
+    def predict_scores_aligned(self, note_ids: Sequence[str]) -> np.ndarray:
+        """Predict GNN scores as a float32 array aligned with note_ids, in one batch"""
+        if not len(note_ids):
+            return np.empty(0, dtype=np.float32)
         
-        # Get features for notes
-        features_list = []
-        category_map = {}
+        x, category_idx = self._build_inputs(note_ids, self._category_ids)
         
-        for note_id in note_ids:
-            features = self.graph_service.get_note_features(note_id)
-            
-            # Encode category as integer
-            if features["category"] not in category_map:
-                category_map[features["category"]] = len(category_map)
-            
-            feature_vector = [
-                features["like_count"] / 100.0,  # normalize
-                features["tag_count"] / 10.0,
-                category_map[features["category"]] / 10.0
-            ]
-            features_list.append(feature_vector)
-        
-        # Create simple edge index (fully connected for simplicity)
-        num_nodes = len(note_ids)
-        edge_index = self._create_dummy_edges(num_nodes)
+        # Predict (GAT embeddings are reused while node features are unchanged)
+        with self._model_lock:
+            embeddings = self._get_embeddings(x, category_idx)
+            scores = self.model.score(embeddings)
         
-        # Convert to tensors
-        x = torch.tensor(features_list, dtype=torch.float)
+        # One device-to-host copy instead of a .item() sync per note
+        return scores.float().cpu().numpy()
+    
+    def _build_inputs(self, note_ids: Sequence[str], category_ids: Dict[str, int]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Build (numeric features, category ids) for the given notes, in order"""
+        # Get features for all notes in a single query
+        features_by_id = self.graph_service.get_notes_features_bulk(note_ids)
+        features = [features_by_id[note_id] for note_id in note_ids]
+        n = len(features)
         
-        # Predict
-        scores = self.model.predict_score(x, edge_index)
+        # Fill a contiguous float32 matrix column by column, then normalize in one pass
+        raw = np.empty((n, 2), dtype=np.float32)
+        raw[:, 0] = np.fromiter((f["view_count"] for f in features), dtype=np.float32, count=n)
+        raw[:, 1] = np.fromiter((f["tag_count"] for f in features), dtype=np.float32, count=n)
+        np.log1p(raw[:, 0], out=raw[:, 0])
+        raw *= _FEATURE_SCALE
         
-        # Create score dictionary
-        result = {}
-        for i, note_id in enumerate(note_ids):
-            result[note_id] = float(scores[i].item())
+        # Category ids index the model's category embedding
+        unknown_id = len(category_ids)
+        categories = np.fromiter(
+            (category_ids.get(f["category"], unknown_id) for f in features),
+            dtype=np.int64,
+            count=n
+        )
         
-        return result
+        # Zero-copy views over the NumPy buffers
+        return torch.from_numpy(raw), torch.from_numpy(categories)
     
-    def _create_dummy_edges(self, num_nodes: int) -> torch.Tensor:
-        """Create a simple edge structure"""
-        if num_nodes == 1:
-            return torch.tensor([[0], [0]], dtype=torch.long)
-        
-        edges = []
-        for i in range(num_nodes):
-            for j in range(i+1, min(i+3, num_nodes)):  # Connect to next 2 nodes
-                edges.append([i, j])
-                edges.append([j, i])
+    def _get_embeddings(self, x: torch.Tensor, category_idx: torch.Tensor) -> torch.Tensor:
+        """Return cached GAT embeddings, recomputing them if the features changed"""
+        cache = self._embedding_cache
+        if cache is not None and torch.equal(cache[0], x) and torch.equal(cache[1], category_idx):
+            return cache[2]
         
-        if not edges:
-            return torch.tensor([[0], [0]], dtype=torch.long)
+        edge_index = self._get_edge_index(x.size(0))
+        embeddings = self.model.compute_embeddings(x, edge_index, category_idx)
+        self._embedding_cache = (x, category_idx, embeddings)
+        return embeddings
+    
+    def invalidate_embeddings(self):
+        """Drop cached embeddings, e.g. after the model weights change"""
+        self._embedding_cache = None
+    
+    def _get_edge_index(self, num_nodes: int) -> torch.Tensor:
+        """Return the edge index (with self-loops) on the model device, built once per graph size"""
+        cache = self._edge_cache
+        if cache is not None and cache[0] == num_nodes:
+            return cache[1]
         
-        edge_index = torch.tensor(edges, dtype=torch.long).t()
+        # Create simple edge index (fully connected for simplicity)
+        edge_index, _ = add_self_loops(self._create_dummy_edges(num_nodes), num_nodes=num_nodes)
+        edge_index = edge_index.to(self.model.device)
+        self._edge_cache = (num_nodes, edge_index)
         return edge_index
     
+    def _create_dummy_edges(self, num_nodes: int) -> torch.Tensor:
+        """Create a simple edge structure (without self-loops)"""
+        # Connect each node to the next 2 nodes, in both directions
+        src1 = torch.arange(max(num_nodes - 1, 0), dtype=torch.long)
+        src2 = torch.arange(max(num_nodes - 2, 0), dtype=torch.long)
+        dst1 = src1 + 1
+        dst2 = src2 + 2
+        
+        return torch.cat([
+            torch.stack([src1, dst1]),
+            torch.stack([dst1, src1]),
+            torch.stack([src2, dst2]),
+            torch.stack([dst2, src2])
+        ], dim=1)
+    
     def train_model(self, training_data: List[Dict]):
-        """Train GNN model with random split"""
+        """
+        Train the GAT to score notes users liked above notes they did not.
+        Full-batch node classification over the note graph, with a random
+        train/validation split of the nodes.
+        """
         if not training_data:
-            print("No training data available")
+            logger.info("No training data available")
             return
         
+        liked = {record["note_id"] for record in training_data if record.get("note_id")}
+        # Same notes, in the same order, that predict_scores_aligned is called with,
+        # so the positional edges seen in training match the ones used for serving
+        note_ids = [note["note_id"] for note in self.graph_service.get_all_notes_with_features()]
+        if len(note_ids) < 2:
+            logger.info("Not enough notes to train on")
+            return
+        
+        # The vocabulary is fixed once a checkpoint persists it. Without one (e.g. Neo4j was
+        # down at startup) derive it now; the category embedding then starts from scratch
+        category_ids = self._category_ids
+        if not category_ids:
+            category_ids = self._load_category_vocabulary() or category_ids
+        
+        # Train a separate copy so requests keep scoring with the current weights meanwhile
+        model = GATRecommender(num_categories=len(category_ids) + 1, device=self.model.device)
+        state_dict = self.model.state_dict()
+        same_vocabulary = category_ids is self._category_ids
+        if not same_vocabulary:
+            state_dict = {k: v for k, v in state_dict.items() if not k.startswith("category_embedding.")}
+        model.load_state_dict(state_dict, strict=same_vocabulary)
+        
+        device = model.device
+        x, category_idx = self._build_inputs(note_ids, category_ids)
+        x = x.to(device, non_blocking=True)
+        category_idx = category_idx.to(device, non_blocking=True)
+        y = torch.tensor([note_id in liked for note_id in note_ids], dtype=torch.float, device=device)
+        edge_index, _ = add_self_loops(self._create_dummy_edges(len(note_ids)), num_nodes=len(note_ids))
+        edge_index = edge_index.to(device)
+        
         # Random split
-        random.shuffle(training_data)
-        split_idx = int(len(training_data) * 0.8)
-        train_data = training_data[:split_idx]
-        val_data = training_data[split_idx:]
-        
-        # Simplified training loop
-        self.model.train()
-        optimizer = torch.optim.Adam(self.model.parameters(), lr=0.001)
-        criterion = nn.BCELoss()
-        
-        for epoch in range(10):
-            optimizer.zero_grad()
+        perm = torch.randperm(len(note_ids), device=device)
+        split_idx = max(int(len(note_ids) * 0.8), 1)
+        train_idx, val_idx = perm[:split_idx], perm[split_idx:]
+        
+        epochs = self.settings.model_train_epochs
+        optimizer = torch.optim.Adam(model.parameters(), lr=self.settings.model_learning_rate)
+        # Logits + BCEWithLogits is the numerically stable form of sigmoid + BCELoss
+        criterion = nn.BCEWithLogitsLoss()
+        
+        for epoch in range(epochs):
+            model.train()
+            optimizer.zero_grad(set_to_none=True)
             
-            # Mock training step
-            loss = torch.tensor(0.5 - epoch * 0.03)  # Dummy decreasing loss
+            embeddings = model(x, edge_index, category_idx)
+            loss = criterion(model.logits(embeddings[train_idx]), y[train_idx])
+            loss.backward()
+            optimizer.step()
             
-            print(f"Epoch {epoch+1}/10, Loss: {loss.item():.4f}")
+            if val_idx.numel():
+                model.eval()
+                with torch.no_grad():
+                    embeddings = model(x, edge_index, category_idx)
+                    val_loss = criterion(model.logits(embeddings[val_idx]), y[val_idx])
+                logger.debug("Epoch %d/%d, Loss: %.4f, Val loss: %.4f", epoch + 1, epochs, loss.item(), val_loss.item())
+            else:
+                logger.debug("Epoch %d/%d, Loss: %.4f", epoch + 1, epochs, loss.item())
         
-        # Save model
-        Path("data").mkdir(exist_ok=True)
-        torch.save(self.model.state_dict(), self.settings.model_checkpoint_path)
-        print(f"Model saved to {self.settings.model_checkpoint_path}")
+        model.eval()
+        with self._model_lock:
+            # Swap in the trained copy together with the vocabulary it was trained on
+            self.model = model
+            self._category_ids = category_ids
+            # Cached embeddings were produced by the old weights
+            self.invalidate_embeddings()
+        
+        # Save model; save_model drops the aliased lin_dst tensors that save_file rejects.
+        # The vocabulary and feature layout go in the header so a restart rebuilds the same model
+        checkpoint_path = Path(self.settings.model_checkpoint_path)
+        checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        metadata = {"categories": orjson.dumps(list(category_ids)).decode(), "features": _FEATURE_LAYOUT}
+        save_model(model, str(checkpoint_path), metadata=metadata)
+        logger.info("Model trained on %d notes (%d liked) and saved to %s", len(note_ids), int(y.sum().item()), checkpoint_path)
 
+@lru_cache()
 def get_gnn_service() -> GNNService:
     return GNNService()
\ No newline at end of file
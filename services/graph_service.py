@@ -1,139 +1,342 @@
+import logging
+import sys
+import threading
+import numpy as np
+from cachetools import TTLCache
+from neo4j.exceptions import Neo4jError
 from database.neo4j_client import get_neo4j_client
-from typing import List, Dict, Any
-from datetime import datetime
+from models.schemas import NoteFromAPI
+from config.settings import get_settings
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import date, datetime, timezone
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_NOTE_FEATURES = {
+    "like_count": 0,
+    "view_count": 0,
+    "download_count": 0,
+    "rating": 0,
+    "tag_count": 0,
+    "category": "unknown"
+}
+
+UPSERT_NOTES_QUERY = """
+UNWIND $rows AS row
+MERGE (n:Note {note_id: row.note_id})
+SET n += row.props,
+    n.like_count = COALESCE(n.like_count, 0),
+    n.updated_at = datetime()
+RETURN count(n) as count
+"""
+
+UPSERT_USERS_QUERY = """
+UNWIND $rows AS row
+MERGE (u:User {user_id: row.user_id})
+SET u += row.props,
+    u.updated_at = datetime()
+RETURN count(u) as count
+"""
+
+LINK_CREATORS_QUERY = """
+UNWIND $rows AS row
+MATCH (u:User {user_id: row.user_id})
+MATCH (n:Note {note_id: row.note_id})
+MERGE (u)-[:CREATED]->(n)
+RETURN count(*) as count
+"""
+
+ALL_NOTES_QUERY = """
+MATCH (n:Note)
+WHERE n.note_id IS NOT NULL AND n.note_id <> '' AND n.title IS NOT NULL
+OPTIONAL MATCH (u:User)-[:CREATED]->(n)
+RETURN n.note_id as note_id,
+       n.title as title,
+       n.rating as rating,
+       n.download_count as download_count,
+       n.view_count as view_count,
+       n.comment_count as comment_count,
+       n.like_count as like_count,
+       n.created_date as created_date,
+       n.created_epoch_days as created_epoch_days,
+       n.is_popular as is_popular,
+       u.user_id as creator_id
+ORDER BY n.view_count DESC
+"""
+
+LIKED_COUNT_QUERY = """
+MATCH (u:User {user_id: $user_id})-[:LIKED]->(n:Note)
+RETURN count(n) as liked_count
+"""
+
+GDS_PAGERANK_QUERY = """
+MATCH (u:User {user_id: $user_id})-[:LIKED]->(liked:Note)
+WITH u, collect(liked) as liked_notes
+CALL gds.pageRank.stream($graph_name, {
+    sourceNodes: liked_notes,
+    maxIterations: 20,
+    dampingFactor: 0.85
+})
+YIELD nodeId, score
+WITH u, gds.util.asNode(nodeId) as candidate, score
+WHERE candidate:Note AND NOT (u)-[:LIKED]->(candidate)
+RETURN candidate.note_id as note_id, score as graph_score
+ORDER BY graph_score DESC
+LIMIT $limit
+"""
+
+# PPR scores are ~0.001-0.1 while the Cypher fallback scores ~0.5-3; GDS scores
+# are rescaled so the best candidate gets the top of the Cypher range and both
+# sources feed the recommendation boost on the same scale
+GDS_TOP_SCORE = 3.0
+
+CYPHER_GRAPH_SCORES_QUERY = """
+MATCH (u:User {user_id: $user_id})-[:LIKED]->(liked:Note)
+MATCH (liked)-[:HAS_TAG]->(t:Tag)<-[:HAS_TAG]-(candidate:Note)
+WHERE NOT (u)-[:LIKED]->(candidate)
+WITH candidate, count(DISTINCT t) as tag_score, candidate.like_count as popularity
+
+OPTIONAL MATCH (candidate)-[:IN_CATEGORY]->(c:Category)<-[:IN_CATEGORY]-(liked2:Note)<-[:LIKED]-(u)
+WITH candidate, tag_score, popularity, count(DISTINCT c) as category_score
+
+WITH candidate, 
+     (tag_score * 0.5 + category_score * 0.3 + popularity * 0.2) as graph_score
+
+RETURN candidate.note_id as note_id, graph_score
+ORDER BY graph_score DESC
+LIMIT $limit
+"""
+
+POPULAR_NOTES_QUERY = """
+MATCH (n:Note)
+WITH n, 
+     COALESCE(n.view_count, 0) * 0.3 + 
+     COALESCE(n.download_count, 0) * 0.3 + 
+     COALESCE(n.like_count, 0) * 0.4 as popularity_score
+RETURN n.note_id as note_id, popularity_score as graph_score
+ORDER BY graph_score DESC
+LIMIT $limit
+"""
+
+NOTES_FEATURES_BULK_QUERY = """
+UNWIND $note_ids AS note_id
+MATCH (n:Note {note_id: note_id})
+OPTIONAL MATCH (n)-[:HAS_TAG]->(t:Tag)
+OPTIONAL MATCH (n)-[:IN_CATEGORY]->(c:Category)
+RETURN note_id,
+       n.like_count as like_count,
+       n.view_count as view_count,
+       n.download_count as download_count,
+       n.rating as rating,
+       count(DISTINCT t) as tag_count,
+       collect(DISTINCT c.name)[0] as category
+"""
+
+CATEGORY_NAMES_QUERY = """
+MATCH (c:Category)
+RETURN c.name as name
+ORDER BY name
+"""
+
+GDS_DROP_QUERY = """
+CALL gds.graph.drop($graph_name, false) YIELD graphName
+RETURN graphName
+"""
+
+GDS_PROJECT_QUERY = """
+CALL gds.graph.project(
+    $graph_name,
+    ['Note', 'Tag', 'Category'],
+    {
+        HAS_TAG: {orientation: 'UNDIRECTED'},
+        IN_CATEGORY: {orientation: 'UNDIRECTED'}
+    }
+)
+YIELD nodeCount, relationshipCount
+RETURN nodeCount, relationshipCount
+"""
+
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+try:
+    # C parser for ISO 8601 dates and datetimes ("Z" included)
+    from ciso8601 import parse_datetime as _parse_iso_datetime
+except ImportError:
+    def _parse_iso_datetime(value: str) -> datetime:
+        # Handle different date formats
+        if "T" in value:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return datetime.strptime(value, "%Y-%m-%d")
+
+
+def _created_epoch_days(created_date: Optional[str]) -> Optional[int]:
+    """UTC days since 1970-01-01 for an API createdDate, or None if missing or unparseable."""
+    if not created_date:
+        return None
+    try:
+        created = _parse_iso_datetime(created_date)
+    except ValueError:
+        return None
+    if created.tzinfo is not None:
+        created = created.astimezone(timezone.utc)
+    return created.date().toordinal() - _EPOCH_ORDINAL
 
 
 class GraphService:
+    __slots__ = (
+        "client", "_gds_graph_name", "_gds_ready", "_gds_stale", "_gds_lock",
+        "_features_cache", "_features_lock", "_notes_version"
+    )
+    
     def __init__(self):
+        settings = get_settings()
         self.client = get_neo4j_client()
+        self._gds_graph_name = settings.gds_graph_name
+        # Set once the in-memory GDS projection exists; PPR uses plain Cypher until then
+        self._gds_ready = False
+        # Set when a Note was created outside a sync and may be missing from the projection
+        self._gds_stale = False
+        # Serializes drop + project between the sync and /like-triggered refreshes
+        self._gds_lock = threading.Lock()
+        
+        # note_id -> GNN features; a short TTL lets like_count changes propagate
+        self._features_cache = TTLCache(
+            maxsize=settings.note_features_cache_size,
+            ttl=settings.note_features_cache_ttl_seconds
+        )
+        self._features_lock = threading.Lock()
+        
+        # Bumped after every note write so readers can drop derived caches
+        self._notes_version = 0
+    
+    @property
+    def notes_version(self) -> int:
+        """Counter incremented whenever Note nodes are written."""
+        return self._notes_version
     
-    def upsert_note(self, note_data: Dict[str, Any]) -> bool:
+    async def upsert_notes_batch_async(self, notes: List[NoteFromAPI]) -> int:
         """
-        Create or update a Note node in Neo4j.
+        Create or update a batch of Note nodes in a single transaction.
+        Returns the number of notes written.
         """
         try:
-            with self.client.get_session() as session:
-                query = """
-                MERGE (n:Note {note_id: $note_id})
-                SET n.title = $title,
-                    n.short_description = $short_description,
-                    n.rating = $rating,
-                    n.download_count = $download_count,
-                    n.view_count = $view_count,
-                    n.comment_count = $comment_count,
-                    n.cover_image_url = $cover_image_url,
-                    n.created_date = $created_date,
-                    n.is_popular = $is_popular,
-                    n.like_count = COALESCE(n.like_count, 0),
-                    n.updated_at = datetime()
-                RETURN n.note_id as note_id
-                """
-                result = session.run(
-                    query,
-                    note_id=note_data.get("id"),
-                    title=note_data.get("title", ""),
-                    short_description=note_data.get("shortDescription", ""),
-                    rating=note_data.get("rating", 0),
-                    download_count=note_data.get("downloadCount", 0),
-                    view_count=note_data.get("viewCount", 0),
-                    comment_count=note_data.get("commentCount", 0),
-                    cover_image_url=note_data.get("coverImageUrl", ""),
-                    created_date=note_data.get("createdDate", ""),
-                    is_popular=note_data.get("isPopular", False)
-                )
-                return result.single() is not None
+            written = await self._write_batch_async(UPSERT_NOTES_QUERY, self._note_rows(notes))
+            self._notes_version += 1
+            return written
         except Exception as e:
-            print(f"Error upserting note: {e}")
-            return False
+            logger.error("Error upserting notes batch: %s", e)
+            return 0
     
-    def upsert_user(self, user_data: Dict[str, Any]) -> bool:
+    async def upsert_users_batch_async(self, users: List[Dict[str, Any]]) -> int:
         """
-        Create or update a User node in Neo4j.
+        Create or update a batch of User nodes in a single transaction.
+        Returns the number of users written.
         """
         try:
-            with self.client.get_session() as session:
-                query = """
-                MERGE (u:User {user_id: $user_id})
-                SET u.full_name = $full_name,
-                    u.first_name = $first_name,
-                    u.last_name = $last_name,
-                    u.username = $username,
-                    u.profile_image_url = $profile_image_url,
-                    u.updated_at = datetime()
-                RETURN u.user_id as user_id
-                """
-                result = session.run(
-                    query,
-                    user_id=user_data.get("id"),
-                    full_name=user_data.get("fullName", ""),
-                    first_name=user_data.get("firstName", ""),
-                    last_name=user_data.get("lastName", ""),
-                    username=user_data.get("userName", ""),
-                    profile_image_url=user_data.get("profileImageUrl", "")
-                )
-                return result.single() is not None
+            return await self._write_batch_async(UPSERT_USERS_QUERY, self._user_rows(users))
         except Exception as e:
-            print(f"Error upserting user: {e}")
-            return False
+            logger.error("Error upserting users batch: %s", e)
+            return 0
     
-    def create_user_created_note(self, user_id: str, note_id: str) -> bool:
+    async def link_creators_batch_async(self, links: List[Dict[str, str]]) -> int:
         """
-        Create CREATED relationship between User and Note.
+        Create CREATED relationships for a batch of {user_id, note_id} pairs.
+        Returns the number of relationships matched or created.
         """
         try:
-            with self.client.get_session() as session:
-                query = """
-                MATCH (u:User {user_id: $user_id})
-                MATCH (n:Note {note_id: $note_id})
-                MERGE (u)-[:CREATED]->(n)
-                RETURN u.user_id as user_id
-                """
-                result = session.run(query, user_id=user_id, note_id=note_id)
-                return result.single() is not None
+            return await self._write_batch_async(LINK_CREATORS_QUERY, links)
         except Exception as e:
-            print(f"Error creating relationship: {e}")
-            return False
+            logger.error("Error creating relationships batch: %s", e)
+            return 0
+    
+    @staticmethod
+    def _note_rows(notes: List[NoteFromAPI]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "note_id": note.id,
+                "props": {
+                    "title": note.title,
+                    "short_description": note.shortDescription,
+                    "rating": note.rating,
+                    "download_count": note.downloadCount,
+                    "view_count": note.viewCount,
+                    "comment_count": note.commentCount,
+                    "cover_image_url": note.coverImageUrl,
+                    "created_date": note.createdDate,
+                    "created_epoch_days": _created_epoch_days(note.createdDate),
+                    "is_popular": note.isPopular
+                }
+            }
+            for note in notes
+        ]
+    
+    @staticmethod
+    def _user_rows(users: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "user_id": user.get("id"),
+                "props": {
+                    "full_name": user.get("fullName", ""),
+                    "first_name": user.get("firstName", ""),
+                    "last_name": user.get("lastName", ""),
+                    "username": user.get("userName", ""),
+                    "profile_image_url": user.get("profileImageUrl", "")
+                }
+            }
+            for user in users
+        ]
+    
+    async def _write_batch_async(self, query: str, rows: List[Dict[str, Any]]) -> int:
+        """Run an UNWIND write query over rows in one managed transaction on the async driver."""
+        if not rows:
+            return 0
+        
+        async def work(tx):
+            result = await tx.run(query, rows=rows)
+            record = await result.single()
+            return record["count"] if record else 0
+        
+        async with self.client.get_async_session() as session:
+            return await session.execute_write(work)
     
     def get_all_notes_with_features(self) -> List[Dict[str, Any]]:
         """
         Get all notes with their features for recommendation.
-        Only returns notes with valid data (note_id and title).
+        Only returns notes with valid data (non-empty note_id and title), so
+        callers can index the result densely without re-checking ids.
+        note_ids are interned: they are long-lived keys of in-memory caches.
         """
         try:
             with self.client.get_session() as session:
-                query = """
-                MATCH (n:Note)
-                WHERE n.note_id IS NOT NULL AND n.title IS NOT NULL
-                OPTIONAL MATCH (u:User)-[:CREATED]->(n)
-                RETURN n.note_id as note_id,
-                       n.title as title,
-                       n.rating as rating,
-                       n.download_count as download_count,
-                       n.view_count as view_count,
-                       n.comment_count as comment_count,
-                       n.like_count as like_count,
-                       n.created_date as created_date,
-                       n.is_popular as is_popular,
-                       u.user_id as creator_id
-                ORDER BY n.view_count DESC
-                """
-                result = session.run(query)
-                return [dict(record) for record in result]
+                result = session.run(ALL_NOTES_QUERY)
+                notes = [dict(record) for record in result]
+            for note in notes:
+                note["note_id"] = sys.intern(note["note_id"])
+            return notes
         except Exception as e:
-            print(f"Error fetching notes: {e}")
+            logger.error("Error fetching notes: %s", e)
             return []
     
-    def personalized_pagerank(self, user_id: str, limit: int = 10) -> List[Dict]:
+    def personalized_pagerank_arrays(self, user_id: str, limit: int = 10) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Run Personalized PageRank from user's liked notes
+        Run Personalized PageRank from user's liked notes.
+        Returns parallel arrays: (note_ids object array, float32 graph scores).
         """
+        candidates = self._graph_candidates(user_id, limit)
+        n = len(candidates)
+        note_ids = np.empty(n, dtype=object)
+        note_ids[:] = [note_id for note_id, _ in candidates]
+        scores = np.fromiter((score for _, score in candidates), dtype=np.float32, count=n)
+        return note_ids, scores
+    
+    def _graph_candidates(self, user_id: str, limit: int) -> List[Tuple[str, float]]:
+        """(note_id, graph_score) pairs, best first, with the popular-notes fallbacks"""
         with self.client.get_session() as session:
             # First check if user has liked any notes
-            check_query = """
-            MATCH (u:User {user_id: $user_id})-[:LIKED]->(n:Note)
-            RETURN count(n) as liked_count
-            """
-            result = session.run(check_query, user_id=user_id)
+            result = session.run(LIKED_COUNT_QUERY, user_id=user_id)
             record = result.single()
             liked_count = record["liked_count"] if record else 0
             
@@ -141,32 +344,20 @@ class GraphService:
                 # Return popular notes if user hasn't liked anything
                 return self._get_popular_notes(session, limit)
             
-            # PPR query: traverse from user's liked notes through tags/categories
-            ppr_query = """
-            MATCH (u:User {user_id: $user_id})-[:LIKED]->(liked:Note)
-            MATCH (liked)-[:HAS_TAG]->(t:Tag)<-[:HAS_TAG]-(candidate:Note)
-            WHERE NOT (u)-[:LIKED]->(candidate)
-            WITH candidate, count(DISTINCT t) as tag_score, candidate.like_count as popularity
-            
-            OPTIONAL MATCH (candidate)-[:IN_CATEGORY]->(c:Category)<-[:IN_CATEGORY]-(liked2:Note)<-[:LIKED]-(u)
-            WITH candidate, tag_score, popularity, count(DISTINCT c) as category_score
-            
-            WITH candidate, 
-                 (tag_score * 0.5 + category_score * 0.3 + popularity * 0.2) as graph_score
+            recommendations = None
+            if self._gds_ready:
+                try:
+                    recommendations = self._gds_pagerank(session, user_id, limit)
+                except Neo4jError as e:
+                    # Projection missing (e.g. mid-refresh or dropped), or a liked note was
+                    # created after it was built; use the Cypher scoring
+                    if self._gds_stale:
+                        logger.debug("GDS projection is being rebuilt, using Cypher scoring: %s", e)
+                    else:
+                        logger.warning("GDS PageRank failed, falling back to Cypher scoring: %s", e)
             
-            RETURN candidate.note_id as note_id, graph_score
-            ORDER BY graph_score DESC
-            LIMIT $limit
-            """
-            
-            result = session.run(ppr_query, user_id=user_id, limit=limit)
-            
-            recommendations = []
-            for record in result:
-                recommendations.append({
-                    "note_id": record["note_id"],
-                    "graph_score": float(record["graph_score"]) if record["graph_score"] else 0.0
-                })
+            if recommendations is None:
+                recommendations = self._cypher_graph_scores(session, user_id, limit)
             
             # If no recommendations from PPR, fall back to popular notes
             if not recommendations:
@@ -174,44 +365,94 @@ class GraphService:
             
             return recommendations
     
-    def _get_popular_notes(self, session, limit: int) -> List[Dict]:
-        """Fallback: return popular notes based on view_count and like_count"""
-        query = """
-        MATCH (n:Note)
-        WITH n, 
-             COALESCE(n.view_count, 0) * 0.3 + 
-             COALESCE(n.download_count, 0) * 0.3 + 
-             COALESCE(n.like_count, 0) * 0.4 as popularity_score
-        RETURN n.note_id as note_id, popularity_score as graph_score
-        ORDER BY graph_score DESC
-        LIMIT $limit
-        """
-        result = session.run(query, limit=limit)
-        
+    @staticmethod
+    def _score_pairs(result) -> List[Tuple[str, float]]:
         return [
-            {"note_id": record["note_id"], "graph_score": float(record["graph_score"]) if record["graph_score"] else 0.0}
+            (record["note_id"], float(record["graph_score"]) if record["graph_score"] else 0.0)
             for record in result
         ]
     
-    def get_note_features(self, note_id: str) -> Dict:
-        """Get node features for GNN"""
-        with self.client.get_session() as session:
-            query = """
-            MATCH (n:Note {note_id: $note_id})
-            OPTIONAL MATCH (n)-[:HAS_TAG]->(t:Tag)
-            OPTIONAL MATCH (n)-[:IN_CATEGORY]->(c:Category)
-            RETURN n.like_count as like_count,
-                   n.view_count as view_count,
-                   n.download_count as download_count,
-                   n.rating as rating,
-                   count(DISTINCT t) as tag_count,
-                   collect(DISTINCT c.name)[0] as category
-            """
-            result = session.run(query, note_id=note_id)
-            record = result.single()
+    def _gds_pagerank(self, session, user_id: str, limit: int) -> List[Tuple[str, float]]:
+        """Personalized PageRank over the projected Note/Tag/Category graph, seeded by liked notes"""
+        result = session.run(GDS_PAGERANK_QUERY, user_id=user_id, graph_name=self._gds_graph_name, limit=limit)
+        pairs = self._score_pairs(result)
+        
+        # Rows are ordered best first; normalize to the Cypher score range
+        top_score = pairs[0][1] if pairs else 0.0
+        if top_score <= 0.0:
+            return pairs
+        scale = GDS_TOP_SCORE / top_score
+        return [(note_id, score * scale) for note_id, score in pairs]
+    
+    def _cypher_graph_scores(self, session, user_id: str, limit: int) -> List[Tuple[str, float]]:
+        """Fallback when GDS is unavailable: score candidates sharing tags/categories with liked notes"""
+        result = session.run(CYPHER_GRAPH_SCORES_QUERY, user_id=user_id, limit=limit)
+        return self._score_pairs(result)
+    
+    def refresh_recommendation_graph(self) -> bool:
+        """
+        (Re)build the in-memory GDS projection used by personalized_pagerank_arrays.
+        The projection is a snapshot, so this runs after syncs change the graph.
+        Returns False (and keeps the Cypher fallback) if GDS is not installed.
+        """
+        with self._gds_lock:
+            # Notes created from here on are not guaranteed to be in the new snapshot
+            self._gds_stale = False
+            try:
+                with self.client.get_session() as session:
+                    session.run(GDS_DROP_QUERY, graph_name=self._gds_graph_name).consume()
+                    record = session.run(GDS_PROJECT_QUERY, graph_name=self._gds_graph_name).single()
+            except Neo4jError as e:
+                self._gds_ready = False
+                logger.warning("GDS projection unavailable, using Cypher graph scoring: %s", e)
+                return False
             
-            if record:
-                return {
+            self._gds_ready = True
+        logger.info(
+            "GDS graph '%s' projected (%d nodes, %d relationships)",
+            self._gds_graph_name, record["nodeCount"], record["relationshipCount"]
+        )
+        return True
+    
+    def mark_projection_stale(self):
+        """
+        Record that a Note was created after the GDS projection was built. PageRank
+        rejects source nodes outside the projection, so until the next refresh those
+        fallbacks to Cypher scoring are expected and not logged as warnings.
+        """
+        self._gds_stale = True
+    
+    def _get_popular_notes(self, session, limit: int) -> List[Tuple[str, float]]:
+        """Fallback: return popular notes based on view_count and like_count"""
+        result = session.run(POPULAR_NOTES_QUERY, limit=limit)
+        return self._score_pairs(result)
+    
+    def get_category_names(self) -> List[str]:
+        """All category names, sorted so indices are stable across restarts"""
+        with self.client.get_session() as session:
+            result = session.run(CATEGORY_NAMES_QUERY)
+            return [record["name"] for record in result if record["name"] is not None]
+    
+    def get_notes_features_bulk(self, note_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Get GNN node features for many notes, keyed by note_id.
+        Recently fetched notes are served from a short TTL cache; the rest are
+        resolved in one query.
+        """
+        with self._features_lock:
+            features = {
+                note_id: self._features_cache[note_id]
+                for note_id in note_ids
+                if note_id in self._features_cache
+            }
+        missing = [note_id for note_id in note_ids if note_id not in features]
+        if not missing:
+            return features
+        
+        with self.client.get_session() as session:
+            result = session.run(NOTES_FEATURES_BULK_QUERY, note_ids=missing)
+            fetched = {
+                record["note_id"]: {
                     "like_count": record["like_count"] or 0,
                     "view_count": record["view_count"] or 0,
                     "download_count": record["download_count"] or 0,
@@ -219,15 +460,27 @@ class GraphService:
                     "tag_count": record["tag_count"] or 0,
                     "category": record["category"] or "unknown"
                 }
-            return {
-                "like_count": 0,
-                "view_count": 0,
-                "download_count": 0,
-                "rating": 0,
-                "tag_count": 0,
-                "category": "unknown"
+                for record in result
             }
+        
+        with self._features_lock:
+            self._features_cache.update(fetched)
+        features.update(fetched)
+        
+        # Notes missing from the graph get default features;
+        # they are not cached so a sync that creates them shows up immediately
+        for note_id in missing:
+            if note_id not in features:
+                features[note_id] = dict(_DEFAULT_NOTE_FEATURES)
+        return features
+    
+    def invalidate_note_features(self, note_ids: List[str]):
+        """Drop cached features for notes whose counts changed (e.g. a new like)"""
+        with self._features_lock:
+            for note_id in note_ids:
+                self._features_cache.pop(note_id, None)
 
 
+@lru_cache()
 def get_graph_service() -> GraphService:
-    return GraphService()
\ No newline at end of file
+    return GraphService()
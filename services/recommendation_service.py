@@ -6,14 +6,103 @@ Implements hybrid recommendation algorithm combining:
 - Recency score (exponential decay based on note age)
 - Random factor (exploration)
 """
-import random
-from typing import List, Dict
-from datetime import datetime, timezone
+import threading
+import zlib
+import numpy as np
+from time import monotonic, time
+from typing import List, Dict, NamedTuple, Optional, Tuple
+from functools import lru_cache, partial
+from cachetools import TTLCache
+from config.settings import get_settings
 from services.graph_service import get_graph_service
 from services.gnn_service import get_gnn_service
+from services._scoring_numba import hybrid_score
 from models.schemas import ABTestGroup
 
 
+class NoteArrays(NamedTuple):
+    """Notes as parallel arrays (structure of arrays); index i is the same note in each."""
+    note_ids: np.ndarray    # object
+    views: np.ndarray       # float32
+    downloads: np.ndarray   # float32
+    ratings: np.ndarray     # float32
+    created_days: np.ndarray  # int32 UTC days since epoch, -1 when unknown
+    index: Dict[str, int]   # note_id -> position in the arrays
+
+
+def build_note_arrays(notes: List[Dict]) -> NoteArrays:
+    """Lay out notes (each with a valid note_id) as aligned NumPy arrays."""
+    n = len(notes)
+    
+    def column(key: str) -> np.ndarray:
+        return np.fromiter((note.get(key) or 0 for note in notes), dtype=np.float32, count=n)
+    
+    id_list = [note["note_id"] for note in notes]
+    note_ids = np.empty(n, dtype=object)
+    note_ids[:] = id_list
+    return NoteArrays(
+        note_ids=note_ids,
+        views=column("view_count"),
+        downloads=column("download_count"),
+        ratings=column("rating"),
+        created_days=np.fromiter(
+            (-1 if note.get("created_epoch_days") is None else note["created_epoch_days"] for note in notes),
+            dtype=np.int32,
+            count=n
+        ),
+        index=dict(zip(id_list, range(n)))
+    )
+
+
+# e^(-days/30) for 0..4095 days; past the end the float32 value is already 0
+_RECENCY_LUT = np.exp(np.arange(4096, dtype=np.float32) * np.float32(-1.0 / 30.0))
+
+
+# (UTC days since epoch, monotonic time at which that day ends)
+_today = (0, 0.0)
+
+
+def _today_epoch_days() -> int:
+    """Current UTC day as days since epoch, recomputed only when the day rolls over."""
+    global _today
+    day, rollover_at = _today
+    now = monotonic()
+    if now >= rollover_at:
+        wall = time()
+        day = int(wall // 86400)
+        _today = (day, now + (day + 1) * 86400 - wall)
+    return day
+
+
+class _ScoreBuffers(threading.local):
+    """Per-thread float32 scratch arrays for the scoring pipeline, reused across requests."""
+    
+    def __init__(self):
+        self.graph = np.empty(0, dtype=np.float32)
+        self.rand = np.empty(0, dtype=np.float32)
+        self.out = np.empty(0, dtype=np.float32)
+    
+    def get(self, n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (graph, rand, out) buffers of length n, reallocating only when n changes."""
+        if self.out.shape[0] != n:
+            self.graph = np.empty(n, dtype=np.float32)
+            self.rand = np.empty(n, dtype=np.float32)
+            self.out = np.empty(n, dtype=np.float32)
+        return self.graph, self.rand, self.out
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting the whole array."""
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < n:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(n)
+    return top[np.argsort(-scores[top])]
+
+
 class RecommendationService:
     """
     Hybrid recommendation service combining multiple scoring methods.
@@ -21,72 +110,184 @@ class RecommendationService:
     Final Score = (0.35 × GAT) + (0.35 × Traditional) + (0.15 × Recency) + (0.15 × Random)
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        gat_weight: float = 0.35,
+        traditional_weight: float = 0.35,
+        recency_weight: float = 0.15,
+        random_weight: float = 0.15
+    ):
         self.graph_service = get_graph_service()
         self.gnn_service = get_gnn_service()
         
         # Weights for hybrid scoring
-        self.gat_weight = 0.35
-        self.traditional_weight = 0.35
-        self.recency_weight = 0.15
-        self.random_weight = 0.15
+        self.gat_weight = gat_weight
+        self.traditional_weight = traditional_weight
+        self.recency_weight = recency_weight
+        self.random_weight = random_weight
+        
+        # Scoring kernel with the weights bound once for the service's lifetime
+        self._score = partial(
+            hybrid_score,
+            w_gat=gat_weight,
+            w_trad=traditional_weight,
+            w_rec=recency_weight,
+            w_rand=random_weight
+        )
+        
+        # Short-lived per-user cache of (limit, note_ids); invalidated on /like
+        settings = get_settings()
+        self._cache = TTLCache(
+            maxsize=settings.recommendation_cache_size,
+            ttl=settings.recommendation_cache_ttl_seconds
+        )
+        self._cache_lock = threading.Lock()
+        
+        # Exploration noise; optionally reproducible per (user, UTC day) so a
+        # user sees a stable ranking for the day
+        self._rng = np.random.default_rng()
+        self._seed_exploration = settings.recommendation_seed_exploration
+        
+        # Note arrays with their traditional and recency scores. Requests only read
+        # them; refresh_scores() rebuilds them in the background when the graph's
+        # notes_version changes or they are older than the TTL (which catches writes
+        # made outside this process), and rolls recency over with the UTC day
+        self._notes_cache: Optional[Tuple[NoteArrays, np.ndarray, np.ndarray]] = None
+        self._notes_version = -1
+        self._recency_day = -1
+        self._notes_loaded_at = 0.0
+        self._notes_ttl = settings.note_arrays_ttl_seconds
+        self._notes_lock = threading.Lock()
+        
+        # Requests run on threadpool workers; each thread keeps its own buffers
+        self._buffers = _ScoreBuffers()
+    
+    def get_cached_recommendations(self, user_id: str, limit: int = 10) -> Optional[List[str]]:
+        """Return cached recommendations for a user, or None on a cache miss."""
+        with self._cache_lock:
+            cached = self._cache.get(user_id)
+        if cached is not None and cached[0] == limit:
+            return cached[1]
+        return None
+    
+    def invalidate_user(self, user_id: str):
+        """Drop cached recommendations for a user (e.g. after a new like)."""
+        with self._cache_lock:
+            self._cache.pop(user_id, None)
     
     def get_recommendations(self, user_id: str, ab_group: ABTestGroup = None, limit: int = 10) -> List[str]:
         """
         Get personalized note recommendations for a user.
         Returns list of note_ids only.
         """
-        # Get all notes with features
+        cached = self.get_cached_recommendations(user_id, limit)
+        if cached is not None:
+            return cached
+        
+        recommendations = self._compute_recommendations(user_id, limit)
+        with self._cache_lock:
+            self._cache[user_id] = (limit, recommendations)
+        return recommendations
+    
+    def refresh_scores(self):
+        """
+        Rebuild the cached score vectors off the request path. Notes are refetched
+        only when the graph's notes changed or the cached copy is older than the TTL;
+        otherwise recency is recomputed on UTC day rollover. Requests keep reading
+        the previous vectors until the new ones are swapped in.
+        """
+        with self._notes_lock:
+            if self._notes_cache is None or self._notes_stale():
+                self._load_notes()
+                return
+            
+            today = _today_epoch_days()
+            if self._recency_day != today:
+                arrays, traditional, _ = self._notes_cache
+                self._notes_cache = (arrays, traditional, self._calculate_recency_scores(arrays, today))
+                self._recency_day = today
+    
+    def _get_note_arrays(self) -> Optional[Tuple[NoteArrays, np.ndarray, np.ndarray]]:
+        """
+        Return (note arrays, traditional scores, recency scores) for all notes.
+        Only the very first call loads them; after that refresh_scores() keeps them current.
+        """
+        cached = self._notes_cache
+        if cached is not None:
+            return cached
+        
+        with self._notes_lock:
+            if self._notes_cache is not None:
+                return self._notes_cache
+            return self._load_notes()
+    
+    def _load_notes(self) -> Optional[Tuple[NoteArrays, np.ndarray, np.ndarray]]:
+        """Fetch notes and rebuild the cached vectors; the caller holds _notes_lock."""
+        version = self.graph_service.notes_version
         all_notes = self.graph_service.get_all_notes_with_features()
+        arrays = build_note_arrays(all_notes)
+        if not len(arrays.note_ids):
+            # Empty graph or failed read: keep serving the previous arrays, if any
+            return self._notes_cache
         
-        if not all_notes:
+        today = _today_epoch_days()
+        self._notes_cache = (
+            arrays,
+            self._calculate_traditional_scores(arrays),
+            self._calculate_recency_scores(arrays, today)
+        )
+        self._notes_version = version
+        self._recency_day = today
+        self._notes_loaded_at = monotonic()
+        return self._notes_cache
+    
+    def _notes_stale(self) -> bool:
+        return (
+            self._notes_version != self.graph_service.notes_version or
+            monotonic() - self._notes_loaded_at >= self._notes_ttl
+        )
+    
+    def _exploration_rng(self, user_id: str) -> np.random.Generator:
+        """Generator for the random score component of one request."""
+        if not self._seed_exploration:
+            return self._rng
+        return np.random.default_rng((zlib.crc32(user_id.encode()), _today_epoch_days()))
+    
+    def _compute_recommendations(self, user_id: str, limit: int) -> List[str]:
+        """Run the hybrid scoring pipeline for a user."""
+        # Get all notes with their precomputed traditional and recency scores
+        notes = self._get_note_arrays()
+        if notes is None:
             return []
+        arrays, traditional_scores, rec = notes
+        ids = arrays.note_ids
+        n = len(ids)
         
         # Get graph-based candidates (personalized if user has history)
-        graph_candidates = self.graph_service.personalized_pagerank(user_id, limit=limit*3)
-        graph_scores = {c["note_id"]: c["graph_score"] for c in graph_candidates}
-        
-        # Get GNN scores
-        note_ids = [note["note_id"] for note in all_notes if note["note_id"]]
-        gnn_scores = self.gnn_service.predict_scores(note_ids) if note_ids else {}
-        
-        # Calculate traditional and recency scores
-        traditional_scores = self._calculate_traditional_scores(all_notes)
-        recency_scores = self._calculate_recency_scores(all_notes)
-        
-        # Combine all scores
-        final_scores = []
-        for note in all_notes:
-            note_id = note.get("note_id")
-            if not note_id:
-                continue
-            
-            # Get individual scores (normalize to 0-1 range)
-            gat_score = gnn_scores.get(note_id, 0.5)
-            trad_score = traditional_scores.get(note_id, 0.0)
-            rec_score = recency_scores.get(note_id, 0.5)
-            rand_score = random.uniform(0, 1)
-            
-            # Add boost from graph-based personalization
-            graph_boost = min(graph_scores.get(note_id, 0) / 10.0, 0.3)
-            
-            # Calculate final score
-            final_score = (
-                self.gat_weight * gat_score +
-                self.traditional_weight * trad_score +
-                self.recency_weight * rec_score +
-                self.random_weight * rand_score +
-                graph_boost  # Additional personalization boost
-            )
-            
-            final_scores.append({
-                "note_id": note_id,
-                "score": final_score
-            })
+        candidate_ids, candidate_scores = self.graph_service.personalized_pagerank_arrays(user_id, limit=limit*3)
+        
+        # Get GNN scores, aligned with ids
+        gat = self.gnn_service.predict_scores_aligned(ids)
+        
+        # Align every score source with arrays.note_ids (normalized to 0-1 range);
+        # graph scores are scattered into place, non-candidates score 0
+        graph, rand, out = self._buffers.get(n)
+        graph.fill(0.0)
+        positions = np.fromiter(
+            (arrays.index.get(note_id, -1) for note_id in candidate_ids),
+            dtype=np.intp,
+            count=candidate_ids.shape[0]
+        )
+        known = positions >= 0
+        graph[positions[known]] = candidate_scores[known]
+        self._exploration_rng(user_id).random(dtype=np.float32, out=rand)
         
-        # Sort by final score and return top N note_ids
-        final_scores.sort(key=lambda x: x["score"], reverse=True)
-        return [item["note_id"] for item in final_scores[:limit]]
+        # Combine all scores in one kernel; the graph-based personalization
+        # boost is capped at 0.3
+        final_scores = self._score(gat, traditional_scores, rec, rand, graph, out=out)
+        
+        # Return top N note_ids by final score (copied out of the buffers)
+        return ids[top_k_indices(final_scores, limit)].tolist()
     
     def get_default_recommendations(self, user_id: str, limit: int = 10) -> List[str]:
         """
@@ -95,82 +296,50 @@ class RecommendationService:
         """
         return self.get_recommendations(user_id, ab_group=None, limit=limit)
     
-    def _calculate_traditional_scores(self, notes: List[Dict]) -> Dict[str, float]:
+    def _calculate_traditional_scores(self, notes: NoteArrays) -> np.ndarray:
         """
-        Calculate traditional popularity scores.
+        Calculate traditional popularity scores, aligned with notes.note_ids.
         Score = 0.3 × normalized_views + 0.3 × normalized_downloads + 0.4 × normalized_rating
         """
-        if not notes:
-            return {}
+        if not len(notes.note_ids):
+            return np.empty(0, dtype=np.float32)
         
         # Find max values for normalization
-        max_views = max(note.get("view_count") or 0 for note in notes) or 1
-        max_downloads = max(note.get("download_count") or 0 for note in notes) or 1
+        max_views = float(notes.views.max()) or 1.0
+        max_downloads = float(notes.downloads.max()) or 1.0
         max_rating = 5.0  # Assuming 5-star rating system
         
-        scores = {}
-        for note in notes:
-            note_id = note.get("note_id")
-            if not note_id:
-                continue
-            
-            # Normalize values
-            norm_views = (note.get("view_count") or 0) / max_views
-            norm_downloads = (note.get("download_count") or 0) / max_downloads
-            norm_rating = (note.get("rating") or 0) / max_rating
-            
-            # Weighted combination
-            score = 0.3 * norm_views + 0.3 * norm_downloads + 0.4 * norm_rating
-            scores[note_id] = score
+        # Fold weight and normalization into one float32 multiplier per column
+        c_views = np.float32(0.3 / max_views)
+        c_downloads = np.float32(0.3 / max_downloads)
+        c_rating = np.float32(0.4 / max_rating)
         
+        scores = notes.views * c_views
+        scores += notes.downloads * c_downloads
+        scores += notes.ratings * c_rating
         return scores
     
-    def _calculate_recency_scores(self, notes: List[Dict]) -> Dict[str, float]:
+    def _calculate_recency_scores(self, notes: NoteArrays, today: int) -> np.ndarray:
         """
-        Calculate recency scores with exponential decay.
-        Newer notes get higher scores.
+        Calculate recency scores with exponential decay, aligned with notes.note_ids.
+        Newer notes get higher scores; unknown dates score 0.5. Dates are stored
+        as epoch days at ingest, so this is a subtraction and a table lookup.
+        today is the current UTC day as days since epoch.
         """
-        if not notes:
-            return {}
+        days_old = today - notes.created_days
         
-        now = datetime.now(timezone.utc)
-        scores = {}
+        # Exponential decay: e^(-days/30) gives half-life of ~21 days
+        scores = _RECENCY_LUT[np.clip(days_old, 0, _RECENCY_LUT.shape[0] - 1)]
         
-        for note in notes:
-            note_id = note.get("note_id")
-            if not note_id:
-                continue
-            
-            created_date_str = note.get("created_date", "")
-            
-            try:
-                # Parse the date string
-                if created_date_str:
-                    # Handle different date formats
-                    if "T" in str(created_date_str):
-                        created_date = datetime.fromisoformat(str(created_date_str).replace("Z", "+00:00"))
-                    else:
-                        created_date = datetime.strptime(str(created_date_str), "%Y-%m-%d")
-                        created_date = created_date.replace(tzinfo=timezone.utc)
-                    
-                    # Calculate days since creation
-                    if created_date.tzinfo is None:
-                        created_date = created_date.replace(tzinfo=timezone.utc)
-                    
-                    days_old = (now - created_date).days
-                    
-                    # Exponential decay: e^(-days/30) gives half-life of ~21 days
-                    import math
-                    score = math.exp(-days_old / 30.0)
-                else:
-                    score = 0.5  # Default for unknown dates
-            except Exception:
-                score = 0.5  # Default on parse error
-            
-            scores[note_id] = score
+        # Future-dated notes fall outside the table
+        future = days_old < 0
+        if future.any():
+            scores[future] = np.exp(days_old[future].astype(np.float32) * np.float32(-1.0 / 30.0))
         
+        scores[notes.created_days < 0] = 0.5
         return scores
 
 
+@lru_cache()
 def get_recommendation_service() -> RecommendationService:
     return RecommendationService()
\ No newline at end of file
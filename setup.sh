@@ -32,7 +32,7 @@ fi
 # Initialize data files
 echo "📝 Initializing data files..."
 echo '{"ab_test_a_like_count": 0, "ab_test_b_like_count": 0, "last_updated": "'$(date -Iseconds)'"}' > data/ab_test_counts.json
-echo '[]' > data/ab_test_likes.json
+touch data/likes_data.jsonl
 
 echo "✓ Setup complete!"
 echo ""
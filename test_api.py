@@ -3,24 +3,29 @@ Quick API testing script
 """
 import requests
 import json
+from requests.adapters import HTTPAdapter
 
 BASE_URL = "http://localhost:8000"
 
+# One keep-alive session so every call reuses a pooled connection
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=10))
+
 def test_health():
     print("\n=== Testing /healthy ===")
-    response = requests.get(f"{BASE_URL}/healthy")
+    response = SESSION.get(f"{BASE_URL}/healthy")
     print(f"Status: {response.status_code}")
     print(f"Response: {response.json()}")
 
 def test_ab_counts():
     print("\n=== Testing /ab_test_counts ===")
-    response = requests.get(f"{BASE_URL}/ab_test_counts")
+    response = SESSION.get(f"{BASE_URL}/ab_test_counts")
     print(f"Status: {response.status_code}")
     print(f"Response: {json.dumps(response.json(), indent=2)}")
 
 def test_like(user_id, note_id, ab_group="A"):
     print(f"\n=== Testing /like (Group {ab_group}) ===")
-    response = requests.post(
+    response = SESSION.post(
         f"{BASE_URL}/like",
         params={
             "user_id": user_id,
@@ -37,7 +42,7 @@ def test_recommend(user_id, ab_group=None):
     if ab_group:
         params["ab_test"] = ab_group
     
-    response = requests.get(f"{BASE_URL}/recommend", params=params)
+    response = SESSION.get(f"{BASE_URL}/recommend", params=params)
     print(f"Status: {response.status_code}")
     
     if response.status_code == 200:
@@ -88,4 +93,6 @@ if __name__ == "__main__":
     except requests.exceptions.ConnectionError:
         print("❌ Error: Cannot connect to API. Make sure the server is running on http://localhost:8000")
     except Exception as e:
-        print(f"❌ Error: {e}")
\ No newline at end of file
+        print(f"❌ Error: {e}")
+    finally:
+        SESSION.close()
\ No newline at end of file